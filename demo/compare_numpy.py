@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.pytorch.star import STAR
+from star.numpy.star import STAR as STARNumpy
+import torch
+import numpy as np
+
+# Compares the numpy backend against the PyTorch model
+batch_size = 8
+np_pose  = np.random.normal(0,1,(batch_size,72))
+np_betas = np.random.normal(0,2,(batch_size,10))
+np_trans = np.random.normal(0,2,(batch_size,3))
+
+for gender in ['female','male','neutral']:
+    for dtype in ['float32','float64']:
+        reference = STAR(gender=gender,num_betas=10,dtype=dtype)
+        torch_dtype = getattr(torch,dtype)
+        d_ref = reference(torch.tensor(np_pose,dtype=torch_dtype),torch.tensor(np_betas,dtype=torch_dtype),torch.tensor(np_trans,dtype=torch_dtype))
+
+        star = STARNumpy(gender=gender,num_betas=10,dtype=dtype)
+        d = star(np_pose,np_betas,np_trans)
+        print('%s %s: vertices %e, v_posed %e, v_shaped %e, joints %e'%(gender,dtype,
+              np.max(np.abs(d-d_ref.numpy())),np.max(np.abs(d.v_posed-d_ref.v_posed.numpy())),
+              np.max(np.abs(d.v_shaped-d_ref.v_shaped.numpy())),np.max(np.abs(d.J_transformed-d_ref.J_transformed.numpy()))))
+
+        J = star.joints(np_pose,np_betas,np_trans)
+        print('%s %s joints only: joints %e'%(gender,dtype,np.max(np.abs(J-d_ref.J_transformed.numpy()))))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.pytorch import export_onnx
+from star.pytorch.star import STAR
+import onnxruntime
+import torch
+import time
+import numpy as np
+
+# Exports the model to ONNX, compares the onnxruntime outputs against the eager model and times both on the CPU
+outputs = ('v','J_transformed')
+for gender in ['female','male','neutral']:
+    path = export_onnx(gender,num_betas=10,path='star_%s.onnx'%(gender),outputs=outputs)
+    session = onnxruntime.InferenceSession(path,providers=['CPUExecutionProvider'])
+    star = STAR(gender=gender,num_betas=10)
+    for batch_size in [1,7,32]:
+        pose  = np.random.normal(0,1,(batch_size,72)).astype(np.float32)
+        betas = np.random.normal(0,2,(batch_size,10)).astype(np.float32)
+        trans = np.random.normal(0,2,(batch_size,3)).astype(np.float32)
+        inputs = {'pose':pose,'betas':betas,'trans':trans}
+        d = session.run(list(outputs),inputs)
+        with torch.no_grad():
+            d_ref = star(torch.tensor(pose),torch.tensor(betas),torch.tensor(trans),outputs=outputs)
+        errors = [np.max(np.abs(a-getattr(d_ref,name).numpy())) for a,name in zip(d,outputs)]
+
+        durations = []
+        for run in [lambda: session.run(list(outputs),inputs),lambda: star(torch.tensor(pose),torch.tensor(betas),torch.tensor(trans),outputs=outputs)]:
+            with torch.no_grad():
+                run()
+                xstart = time.time()
+                for i in range(20):
+                    run()
+            durations.append((time.time()-xstart)/20)
+        print('%s batch size %d: vertices %e, joints %e, ONNX %f, Eager %f'%(gender,batch_size,errors[0],errors[1],durations[0],durations[1]))
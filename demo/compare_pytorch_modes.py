@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.pytorch.star import STAR
+import torch
+import numpy as np
+
+batch_size = 8
+np_pose  = np.random.normal(0,1,(batch_size,72))
+np_betas = np.random.normal(0,2,(batch_size,10))
+np_trans = np.random.normal(0,2,(batch_size,3))
+
+pose  = torch.tensor(np_pose,dtype=torch.float32)
+betas = torch.tensor(np_betas,dtype=torch.float32)
+trans = torch.tensor(np_trans,dtype=torch.float32)
+
+def max_error(a,b):
+    return np.max(np.abs(a.detach().cpu().numpy()-b.detach().cpu().numpy()))
+
+for gender in ['female','male','neutral']:
+    # The dense model is the reference every other evaluation mode is compared against
+    reference = STAR(gender=gender,num_betas=10,pose_blend='dense')
+    d_ref = reference(pose,betas,trans)
+
+    star = STAR(gender=gender,num_betas=10,pose_blend='sparse')
+    d = star(pose,betas,trans)
+    print('%s sparse pose blend shapes: vertices %e, v_posed %e'%(gender,max_error(d,d_ref),max_error(d.v_posed,d_ref.v_posed)))
+    assert max_error(d,d_ref) < 1e-4 and max_error(d.v_posed,d_ref.v_posed) < 1e-4
+
+    star = STAR(gender=gender,num_betas=10,skinning='sparse')
+    d = star(pose,betas,trans)
+    print('%s sparse skinning: vertices %e'%(gender,max_error(d,d_ref)))
+
+    star = STAR(gender=gender,num_betas=10,cache_size=16)
+    d = star.rest_pose(betas,trans)
+    d_rest = reference(torch.zeros_like(pose),betas,trans)
+    print('%s rest pose: vertices %e, joints %e'%(gender,max_error(d,d_rest),max_error(d.J_transformed,d_rest.J_transformed)))
+
+    J = star.joints(pose,betas,trans)
+    print('%s joints only: joints %e'%(gender,max_error(J,d_ref.J_transformed)))
+
+    vertex_ids = np.random.choice(6890,300,replace=False)
+    d = star(pose,betas,trans,vertex_ids=vertex_ids)
+    print('%s vertex subset: vertices %e'%(gender,max_error(d,d_ref[:,vertex_ids])))
+
+    d = star(pose,betas,trans,outputs=('v','J_transformed'))
+    print('%s selected outputs: vertices %e, joints %e'%(gender,max_error(d.v,d_ref),max_error(d.J_transformed,d_ref.J_transformed)))
+
+    star = STAR(gender=gender,num_betas=10,workspace=True)
+    with torch.no_grad():
+        for i in range(2):
+            d = star(pose,betas,trans)
+    print('%s workspace: vertices %e, joints %e'%(gender,max_error(d,d_ref),max_error(d.J_transformed,d_ref.J_transformed)))
+
+    star = STAR(gender=gender,num_betas=10,dtype='float64')
+    d = star(pose.double(),betas.double(),trans.double())
+    print('%s float64 model: vertices %e'%(gender,max_error(d,d_ref)))
+
+    d = reference.evaluate_chunked(np_pose,np_betas,np_trans,max_bytes=2**20)
+    print('%s chunked evaluation: vertices %e'%(gender,np.max(np.abs(d.v-d_ref.detach().numpy()))))
+
+    # The analytic backward is compared against autograd differentiating the dense model
+    target = torch.randn(batch_size,6890,3)
+    gradients = []
+    for star in [reference,STAR(gender=gender,num_betas=10,gradients='analytic')]:
+        parameters = [pose.clone().requires_grad_(),betas.clone().requires_grad_(),trans.clone().requires_grad_()]
+        torch.sum((star(*parameters)-target)**2).backward()
+        gradients.append([parameter.grad for parameter in parameters])
+    print('%s analytic gradients: pose %e, betas %e, trans %e'%((gender,)+tuple(max_error(a,b)/np.max(np.abs(a.numpy())) for a,b in zip(*gradients))))
+
+from star.pytorch.incremental import STARIncremental
+star = STAR(gender='female',num_betas=10)
+incremental = STARIncremental(star)
+d = incremental.update(pose,betas,trans)
+for joint in [0,4,20]:
+    pose[:,3*joint:3*joint+3] += 0.1
+    d = incremental.update(pose=pose)
+    d_ref = star(pose,betas,trans)
+    print('female incremental joint %d: vertices %e, joints %e'%(joint,max_error(d.v,d_ref),max_error(d.J_transformed,d_ref.J_transformed)))
+trans = trans + 1.0
+d = incremental.update(trans=trans)
+print('female incremental trans: vertices %e'%(max_error(d.v,star(pose,betas,trans))))
+
+from star.pytorch.star import STARMulti
+star = STARMulti(genders=('male','female','neutral'),num_betas=10)
+gender = np.random.randint(0,3,batch_size)
+d = star(pose,betas,trans,torch.tensor(gender))
+for i,name in enumerate(star.genders):
+    ids = np.where(gender == i)[0]
+    if len(ids) == 0:
+        continue
+    d_ref = STAR(gender=name,num_betas=10)(pose[ids],betas[ids],trans[ids])
+    print('%s mixed gender batch: vertices %e, joints %e'%(name,max_error(d[ids],d_ref),max_error(d.J_transformed[ids],d_ref.J_transformed)))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.tf import export_saved_model
+from star.tf.star import STAR
+import tensorflow as tf
+import time
+import numpy as np
+
+# Exports the model to a SavedModel, compares its signatures against the Python model and times both on the CPU
+for gender in ['female','male','neutral']:
+    path = export_saved_model(gender,path='star_%s_saved_model'%(gender),num_betas=10)
+    loaded = tf.saved_model.load(path)
+    star = STAR(gender=gender,num_betas=10)
+    for batch_size in [1,7,32]:
+        pose  = tf.random.normal((batch_size,72),dtype=tf.float32)
+        betas = tf.random.normal((batch_size,10),0,2,dtype=tf.float32)
+        trans = tf.random.normal((batch_size,3),0,2,dtype=tf.float32)
+        d = loaded.signatures['vertices'](pose=pose,betas=betas,trans=trans)
+        d_joints = loaded.signatures['joints'](pose=pose,betas=betas,trans=trans)
+        d_shape = loaded.signatures['shape'](betas=betas)
+        v_ref = star(pose,betas,trans)
+        v_shaped_ref, J_ref = star.shape(betas)
+        errors = [np.max(np.abs(d['v'].numpy()-v_ref.numpy())),
+                  np.max(np.abs(d_joints['J_transformed'].numpy()-v_ref.Jtr.numpy())),
+                  np.max(np.abs(d_shape['v_shaped'].numpy()-v_shaped_ref.numpy())),
+                  np.max(np.abs(d_shape['J'].numpy()-J_ref.numpy()))]
+
+        durations = []
+        for run in [lambda: loaded.signatures['vertices'](pose=pose,betas=betas,trans=trans),
+                    lambda: loaded.signatures['joints'](pose=pose,betas=betas,trans=trans),
+                    lambda: star(pose,betas,trans)]:
+            run()
+            xstart = time.time()
+            for i in range(20):
+                run()
+            durations.append((time.time()-xstart)/20)
+        print('%s batch size %d: vertices %e, joints %e, shape %e %e, SavedModel %f, Joints only %f, Python %f'%((gender,batch_size)+tuple(errors)+tuple(durations)))
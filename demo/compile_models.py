@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.assets import compile_model
+from star.config import cfg
+import os
+
+# Writes the configured models as memory mapped model directories next to the .npz files,
+# point the model paths of config.py to these directories to load them. The arrays are stored
+# in cfg.data_type so that they are used without a copy, the models then refuse to be evaluated
+# in a higher precision
+for path_model in [cfg.path_male_star,cfg.path_female_star,cfg.path_neutral_star]:
+    path_compiled = os.path.splitext(path_model)[0] + '_compiled'
+    compile_model(path_model,path_compiled,dtype=cfg.data_type)
+    print('Compiled %s to %s'%(path_model,path_compiled))
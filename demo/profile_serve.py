@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.pytorch.star import STAR
+from star.serve import STARServer
+import asyncio
+import torch
+import time
+import numpy as np
+
+# Load generator comparing one forward pass per request against the micro-batching server,
+# each client sends its requests one after the other like a customer would
+num_clients  = 64
+num_requests = 20
+star = STAR(gender='female',num_betas=10)
+
+def request():
+    return np.random.randn(72)*0.2, np.random.randn(10), np.random.randn(3)
+
+async def client(infer):
+    for i in range(num_requests):
+        await infer(*request())
+
+async def run(infer):
+    xstart = time.time()
+    await asyncio.gather(*[client(infer) for i in range(num_clients)])
+    return num_clients*num_requests/(time.time()-xstart)
+
+async def unbatched(pose,betas,trans):
+    with torch.no_grad():
+        star(torch.tensor(pose[None],dtype=torch.float32),torch.tensor(betas[None],dtype=torch.float32),torch.tensor(trans[None],dtype=torch.float32))
+
+async def main():
+    print('Unbatched, %.1f requests/s'%(await run(unbatched)))
+    for max_batch in [8,32,64]:
+        for max_wait in [0.001,0.005]:
+            async with STARServer(star,max_batch=max_batch,max_wait=max_wait) as server:
+                print('Max Batch %d, Max Wait %.3fs, %.1f requests/s'%(max_batch,max_wait,await run(server.infer)))
+
+asyncio.run(main())
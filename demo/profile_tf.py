@@ -25,8 +25,8 @@ import time
 import numpy as np 
 
 list_batch_size = [2,4,8,16,32,64,128,256,512]
+star = STAR()
 for batch_size in list_batch_size:
-    star = STAR()
     pose  = tf.random.normal((batch_size,72),dtype=tf.float32) 
     betas = tf.random.normal((batch_size,10),dtype=tf.float32)
     trans = tf.random.normal((batch_size,3),dtype=tf.float32)
@@ -35,4 +35,5 @@ for batch_size in list_batch_size:
         xstart = time.time()
         verts = star(pose,betas,trans)
         list_time.append(time.time()-xstart)
-    print('Batch Size %d, Duration %f'%(batch_size,np.mean(list_time[10:])))
+    # The graph is traced once for all the batch sizes, the first call of a batch size is not slower
+    print('Batch Size %d, Duration %f, First Call %f, Traces %d'%(batch_size,np.mean(list_time[10:]),list_time[0],star.forward.experimental_get_tracing_count()))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.tf.star import STAR
+import tensorflow as tf
+import time
+import numpy as np
+
+# Compares the TensorFlow STAR forward pass against the XLA compiled one with the fused skinning on the CPU
+with tf.device('/CPU:0'):
+    graph = STAR(gender='female',num_betas=10)
+    xla   = STAR(gender='female',num_betas=10,jit_compile=True)
+
+    list_batch_size = [1,2,4,8,16,32,64,128]
+    for batch_size in list_batch_size:
+        pose  = tf.random.normal((batch_size,72),dtype=tf.float32)
+        betas = tf.random.normal((batch_size,10),dtype=tf.float32)
+        trans = tf.random.normal((batch_size,3),dtype=tf.float32)
+        durations = {}
+        for name,star in [('graph',graph),('xla',xla)]:
+            list_time = []
+            for i in range(0,40):
+                xstart = time.time()
+                verts = star(pose,betas,trans).numpy()
+                list_time.append(time.time()-xstart)
+            # The first iterations include the compilation for this batch size
+            durations[name] = np.mean(list_time[10:])
+        error = np.max(np.abs(graph(pose,betas,trans).numpy()-xla(pose,betas,trans).numpy()))
+        print('Batch Size %d, Graph %f, XLA %f, Speedup %.2fx, Max Error %e'%(batch_size,durations['graph'],durations['xla'],durations['graph']/durations['xla'],error))
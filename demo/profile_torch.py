@@ -26,8 +26,8 @@ import torch
 import numpy as np 
 from torch.autograd import Variable
 list_batch_size = [2,4,8,16,32,64,128,256,512]
+star = STAR()
 for batch_size in list_batch_size:
-    star = STAR()
     poses = torch.cuda.FloatTensor(np.zeros((batch_size,72)))
     poses = Variable(poses,requires_grad=True)
     betas = torch.cuda.FloatTensor(np.zeros((batch_size,10)))
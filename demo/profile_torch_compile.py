@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+from star.pytorch.star import STAR
+import torch
+import time
+import numpy as np
+
+# Compares the eager and the compiled PyTorch STAR forward pass on the CPU
+eager    = STAR(gender='female',num_betas=10)
+compiled = STAR(gender='female',num_betas=10,compile=True)
+
+list_batch_size = [1,2,4,8,16,32,64]
+for batch_size in list_batch_size:
+    pose  = torch.randn(batch_size,72)
+    betas = torch.randn(batch_size,10)
+    trans = torch.randn(batch_size,3)
+    durations = {}
+    for name,star in [('eager',eager),('compiled',compiled)]:
+        list_time = []
+        with torch.no_grad():
+            for i in range(0,60):
+                xstart = time.time()
+                d = star(pose,betas,trans)
+                list_time.append(time.time()-xstart)
+        # The first iterations include the compilation of the graph
+        durations[name] = np.mean(list_time[10:])
+    print('Batch Size %d, Eager %f, Compiled %f, Speedup %.2fx'%(batch_size,durations['eager'],durations['compiled'],durations['eager']/durations['compiled']))
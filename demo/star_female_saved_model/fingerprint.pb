@@ -0,0 +1 @@
+Ōɠ?ƒɻ ˇ;(2:'197954351736621642279637993144172036236
\ No newline at end of file
@@ -0,0 +1 @@
+ޮkɠ?ƒɻ ˇ;(ڃH2:'176932685061183313981424929725203121924
\ No newline at end of file
@@ -0,0 +1 @@
+ɠ?ƒɻ ˇ;(߹2:&69747750818466550620353703273832729311
\ No newline at end of file
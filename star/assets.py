@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import atexit
+import mmap
+import numpy as np
+import os
+import shutil
+import tempfile
+
+# Arrays of the models loaded by this process, keyed on the model path
+_models = {}
+# Compiled models written by share_memory, keyed on the model path, and the process removing them on exit
+_owned_dirs = {}
+_owner = os.getpid()
+
+
+def load_model(path_model):
+    '''
+        Loads the arrays of a STAR model once per process, every backend and every
+        model instance gets the same read-only arrays
+    :param path_model: path of the model .npz file, or of a model directory written
+                       by compile_model whose arrays are memory mapped
+    :return: A dictionary of read-only numpy arrays
+    '''
+    path_model = os.path.abspath(path_model)
+    if path_model not in _models:
+        if os.path.isdir(path_model):
+            arrays = _map_compiled(path_model)
+        else:
+            with np.load(path_model, allow_pickle=True) as star_model:
+                arrays = {name: np.ascontiguousarray(star_model[name]) for name in star_model.files}
+            for array in arrays.values():
+                array.setflags(write=False)
+        _models[path_model] = arrays
+    return _models[path_model]
+
+
+def _map_compiled(path_compiled):
+    # Copy on write mappings, a write to a model buffer stays in the process instead of faulting
+    arrays = {name[:-4]: np.load(os.path.join(path_compiled, name), mmap_mode='c')
+              for name in sorted(os.listdir(path_compiled)) if name.endswith('.npy')}
+    # The shape basis is stored betas major, so that its first betas are contiguous
+    arrays['shapedirs'] = arrays.pop('shapedirs_betas').transpose(1, 2, 0)
+    for array in arrays.values():
+        array.setflags(write=False)
+    return arrays
+
+
+def private_mapping(array):
+    '''
+        Maps the file a memory mapped model array is read from once more, copy on write. The
+        pages are shared with the array until they are written to, the writes stay private to
+        the new mapping and are seen neither by the array nor by the other backends
+    :param array: A model array returned by load_model, or a contiguous view of one
+    :return: A writable numpy array of the same values, None when the array is not a
+             contiguous view of a memory mapped file
+    '''
+    mapped = array
+    while mapped is not None and not (isinstance(mapped, np.memmap) and mapped._mmap is not None):
+        mapped = mapped.base
+    if mapped is None or mapped.filename is None or not array.flags.c_contiguous:
+        return None
+    # The file mapping starts at the allocation granularity boundary below the memmap offset
+    start = mapped.offset - mapped.offset % mmap.ALLOCATIONGRANULARITY
+    offset = start + array.ctypes.data - np.frombuffer(mapped._mmap, dtype=np.uint8).ctypes.data
+    return np.memmap(mapped.filename, dtype=array.dtype, mode='c', offset=offset, shape=array.shape)
+
+
+def compile_model(path_model, path_compiled, dtype=None):
+    '''
+        Writes a STAR model as a directory of uncompressed .npy files that load_model
+        memory maps, along with the data the backends otherwise derive at load time:
+            parent, kintree_edges                   : the kinematic tree
+            level_joints, level_parents, level_sizes: the joints grouped by depth
+            posedirs_indptr, posedirs_indices,
+            posedirs_data                           : posedirs as a 20670 x 93 CSR matrix
+            skinning_joints, skinning_weights       : the joints influencing each vertex
+            J_template, J_shapedirs                 : the joint shape basis
+        shapedirs is written betas major as shapedirs_betas, load_model returns it in the
+        usual vertices x 3 x betas shape
+    :param path_model: path of the model .npz file
+    :param path_compiled: output directory
+    :param dtype: data type of the floating point arrays, defaults to the precision of the
+                  model file. The backends refuse to evaluate a model in a higher precision
+                  than it was compiled with
+    '''
+    with np.load(path_model, allow_pickle=True) as star_model:
+        arrays = {name: star_model[name] for name in star_model.files}
+
+    kintree_table = arrays['kintree_table']
+    id_to_col = {kintree_table[1, i]: i for i in range(kintree_table.shape[1])}
+    parent = np.array([id_to_col[kintree_table[0, i]] for i in range(1, kintree_table.shape[1])], dtype=np.int64)
+    level_joints, level_parents, level_sizes = kinematic_levels(parent.tolist())
+    weights = arrays['weights']
+    max_influences = int(np.max(np.sum(weights != 0, axis=1)))
+    skinning_joints = np.argsort(-weights, axis=1, kind='stable')[:, :max_influences]
+    posedirs = arrays['posedirs'].reshape((-1, 93))
+    rows, cols = np.nonzero(posedirs)
+
+    derived = {
+        'parent': parent,
+        'kintree_edges': np.stack([parent, np.arange(1, len(parent) + 1)], axis=1),
+        'level_joints': np.array(level_joints, dtype=np.int64),
+        'level_parents': np.array(level_parents, dtype=np.int64),
+        'level_sizes': np.array(level_sizes, dtype=np.int64),
+        'posedirs_indptr': np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=posedirs.shape[0]))]).astype(np.int32),
+        'posedirs_indices': cols.astype(np.int32),
+        'posedirs_data': posedirs[rows, cols],
+        'skinning_joints': skinning_joints.astype(np.int64),
+        'skinning_weights': np.take_along_axis(weights, skinning_joints, axis=1),
+        'J_template': arrays['J_regressor'].dot(arrays['v_template']),
+        'J_shapedirs': np.einsum('ji,ikl->jkl', arrays['J_regressor'], arrays['shapedirs']),
+    }
+    arrays.update(derived)
+    arrays['shapedirs_betas'] = arrays.pop('shapedirs').transpose(2, 0, 1)
+
+    if not os.path.exists(path_compiled):
+        os.makedirs(path_compiled)
+    for name, array in arrays.items():
+        if array.dtype.kind == 'f' and dtype is not None:
+            array = array.astype(dtype)
+        np.save(os.path.join(path_compiled, name + '.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def check_precision(path_model, arrays, dtype):
+    '''
+        Refuses to evaluate a model in a higher precision than the one its arrays are stored in,
+        compiled or shared in, the results would silently carry the rounding of the stored arrays
+    :param path_model: path of the model
+    :param arrays: the arrays returned by load_model
+    :param dtype: name of the data type of the evaluation
+    '''
+    stored = arrays['v_template'].dtype
+    if np.dtype('float16' if dtype == 'bfloat16' else dtype).itemsize > stored.itemsize:
+        raise RuntimeError('The model %s stores %s arrays, compile or share it again to evaluate it in %s' % (path_model, stored.name, dtype))
+
+
+def share_memory(dtype=None):
+    '''
+        Compiles the .npz models loaded so far to memory mapped directories in a temporary
+        location, see compile_model, and maps them in place of the .npz arrays. Worker
+        processes forked afterwards map the same pages, processes started otherwise attach
+        to them with attach_shared_memory and the returned handles. Compiled models already
+        share the pages of the page cache.
+
+        The PyTorch models only use the shared pages when they are evaluated in the data type
+        the models are shared in, they copy the arrays otherwise. The Tensorflow models always
+        copy the arrays into their variables
+    :param dtype: data type of the floating point arrays, defaults to cfg.data_type
+    :return: A picklable dictionary describing the shared models
+    '''
+    global _owner
+    if dtype is None:
+        from .config import cfg
+        dtype = cfg.data_type
+    if not _owned_dirs:
+        _owner = os.getpid()
+    handles = {}
+    for path_model in list(_models):
+        if os.path.isdir(path_model):
+            handles[path_model] = None
+            continue
+        if path_model not in _owned_dirs:
+            path_compiled = tempfile.mkdtemp(prefix='star_', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            compile_model(path_model, path_compiled, dtype)
+            _owned_dirs[path_model] = path_compiled
+            _models[path_model] = _map_compiled(path_compiled)
+        handles[path_model] = _owned_dirs[path_model]
+    return handles
+
+
+def attach_shared_memory(handles):
+    '''
+        Maps the models shared by another process with share_memory
+    :param handles: The dictionary returned by share_memory
+    '''
+    for path_model, path_compiled in handles.items():
+        if path_compiled is None:
+            load_model(path_model)
+        else:
+            _models[path_model] = _map_compiled(path_compiled)
+
+
+def kinematic_levels(parent):
+    '''
+        Groups the joints of a kinematic tree by their depth, so that all the joints
+        of one depth level can be composed with their parents at once
+
+    :param parent: A list with the parent index of every joint except the root (joint 0)
+    :return: joints : joint indices ordered by depth
+             parents: for every non root joint in that order, the position of its parent
+                      within the previous depth level
+             sizes  : number of joints in each depth level
+    '''
+    depth = [0]
+    for i in range(1, len(parent) + 1):
+        depth.append(depth[parent[i - 1]] + 1)
+    levels = [[i for i in range(len(depth)) if depth[i] == d] for d in range(max(depth) + 1)]
+    joints = [i for level in levels for i in level]
+    parents = [levels[d - 1].index(parent[i - 1]) for d in range(1, len(levels)) for i in levels[d]]
+    sizes = [len(level) for level in levels]
+    return joints, parents, sizes
+
+
+@atexit.register
+def _release_shared_memory():
+    _models.clear()
+    # Only the process that compiled the shared models removes them, the processes mapping
+    # them keep their pages until they exit
+    if os.getpid() == _owner:
+        for path_compiled in _owned_dirs.values():
+            shutil.rmtree(path_compiled, ignore_errors=True)
+    _owned_dirs.clear()
@@ -24,6 +24,7 @@ import numpy as np
 import os
 from .verts import verts_decorated_quat 
 from ..config import cfg
+from ..assets import load_model
 
 def STAR(gender='female',num_betas=10):
 
@@ -43,7 +44,7 @@ def STAR(gender='female',num_betas=10):
         raise RuntimeError('Path does not exist %s'%(fname))
 
 
-    model_dict  = np.load(fname,allow_pickle=True)
+    model_dict  = load_model(fname)
     trans       = ch.array(np.zeros(3))
     posedirs    = ch.array(model_dict['posedirs'])
     v_tempalate = ch.array(model_dict['v_template'])
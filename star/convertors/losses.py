@@ -77,7 +77,8 @@ def convert_smpl_2_star(smpl,MAX_ITER_EDGES,MAX_ITER_VERTS,NUM_BETAS,GENDER):
         warnings.warn(
             'The Default optimization parameters (MAX_ITER_EDGES,MAX_ITER_VERTS) were tested on batch size 32 or smaller batches')
 
-    star = STAR(gender=GENDER)
+    # Most of the fitting time is spent in the backward pass
+    star = STAR(gender=GENDER,gradients='analytic')
     global_pose = torch.cuda.FloatTensor(np.zeros((batch_size, 3)))
     global_pose = Variable(global_pose, requires_grad=True)
     joints_pose = torch.cuda.FloatTensor(np.zeros((batch_size, 72 - 3)))
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import numpy as np
+import os
+from collections import namedtuple
+from .utils import rodrigues , quat_feat
+from ..config import cfg
+from ..assets import load_model , kinematic_levels , check_precision
+
+# The outputs of a STAR evaluation, as in the PyTorch backend
+STAROutput = namedtuple('STAROutput', ['v', 'v_posed', 'v_shaped', 'J', 'J_transformed'])
+
+class STARVertices(np.ndarray):
+    '''
+        The vertices returned by STAR.forward, the other outputs are attached as attributes
+    '''
+    pass
+
+class STAR(object):
+    '''
+        STAR evaluated with numpy only, for the services that do not need gradients or a deep
+        learning framework. The model bases are flattened once at load, the joints are regressed
+        from a joint shape basis and the kinematic tree is composed one depth level at a time.
+    '''
+    def __init__(self, gender='female', num_betas=10, dtype=None):
+        '''
+        :param gender: male, female or neutral
+        :param num_betas: number of shape parameters
+        :param dtype: data type of the model arrays, defaults to cfg.data_type
+        '''
+        if gender not in ['male', 'female', 'neutral']:
+            raise RuntimeError('Invalid Gender')
+
+        dtype = np.dtype(cfg.data_type if dtype is None else dtype)
+        if dtype not in [np.float16, np.float32, np.float64]:
+            raise RuntimeError('Invalid data type %s' % (dtype))
+
+        if gender == 'male':
+            path_model = cfg.path_male_star
+        elif gender == 'female':
+            path_model = cfg.path_female_star
+        else:
+            path_model = cfg.path_neutral_star
+
+        if not os.path.exists(path_model):
+            raise RuntimeError('Path does not exist %s' % (path_model))
+
+        star_model = load_model(path_model)
+        check_precision(path_model, star_model, dtype.name)
+        self.num_betas = num_betas
+        self.dtype = dtype
+
+        # The arrays already in the right layout and data type are used without a copy
+        def array(name, value=None):
+            value = star_model[name] if value is None else value
+            return np.ascontiguousarray(value, dtype=dtype)
+
+        self.J_regressor = array('J_regressor')
+        self.weights = array('weights')
+        self.posedirs = array('posedirs', star_model['posedirs'].reshape(-1, 93))
+        self.v_template = array('v_template')
+        # betas major, the compiled models store it in this layout
+        self.shapedirs = array('shapedirs', star_model['shapedirs'].transpose(2, 0, 1)[:num_betas].reshape(num_betas, -1))
+        if 'J_template' in star_model:
+            self.J_template = array('J_template')
+            self.J_shapedirs = array('J_shapedirs', star_model['J_shapedirs'][:, :, :num_betas].reshape(-1, num_betas))
+        else:
+            J_regressor = star_model['J_regressor']
+            self.J_template = array('J_template', J_regressor.dot(star_model['v_template']))
+            self.J_shapedirs = array('J_shapedirs', np.einsum('ji,ikl->jkl', J_regressor, star_model['shapedirs'][:, :, :num_betas]).reshape(-1, num_betas))
+        self.f = star_model['f']
+        self.kintree_table = star_model['kintree_table']
+
+        if 'parent' in star_model:
+            self.parent = np.asarray(star_model['parent'], dtype=np.int64)
+        else:
+            id_to_col = {self.kintree_table[1, i]: i for i in range(self.kintree_table.shape[1])}
+            self.parent = np.array([id_to_col[self.kintree_table[0, it]] for it in range(1, self.kintree_table.shape[1])], dtype=np.int64)
+
+        # Joints grouped by depth in the kinematic tree, each depth level is composed with a single matmul
+        if 'level_joints' in star_model:
+            level_joints, level_parents, self.level_sizes = [star_model[name].tolist() for name in ['level_joints', 'level_parents', 'level_sizes']]
+        else:
+            level_joints, level_parents, self.level_sizes = kinematic_levels(self.parent.tolist())
+        self.level_joints = np.array(level_joints, dtype=np.int64)
+        self.level_parents = np.array(level_parents, dtype=np.int64)
+        self.level_inverse = np.argsort(self.level_joints)
+
+    def shape_blend_shapes(self, betas):
+        '''
+            Evaluates the shaped T-pose vertices and the rest joints
+        :param betas: beta parameters - A batch size x number of betas
+        :return:
+                 v_shaped: batch size x 6890 x 3 vertices after adding the shape blend shapes
+                 J       : batch size x 24 x 3 rest joints
+        '''
+        v_shaped = np.matmul(betas, self.shapedirs).reshape(betas.shape[0], -1, 3) + self.v_template[None, :]
+        return v_shaped, self.joints_rest(betas)
+
+    def joints_rest(self, betas):
+        '''
+            Regresses the rest pose joints from the joint shape basis
+        :param betas: beta parameters - A batch size x number of betas
+        :return: batch size x 24 x 3 rest joints
+        '''
+        return np.matmul(betas, self.J_shapedirs.T).reshape(-1, 24, 3) + self.J_template[None, :]
+
+    def pose_blend_shapes(self, pose_feat):
+        '''
+            Evaluates the pose corrective blend shapes
+        :param pose_feat: pose features - A batch size x 93 array
+        :return: batch size x 6890 x 3 vertex offsets
+        '''
+        return np.matmul(pose_feat, self.posedirs.T).reshape(pose_feat.shape[0], -1, 3)
+
+    def global_rigid_transformation(self, R, J):
+        '''
+            Composes the joint transforms along the kinematic tree
+        :param R: batch size x 24 x 3 x 3 joint rotations
+        :param J: batch size x 24 x 3 rest pose joint locations
+        :return: batch size x 24 x 4 x 4 global joint transforms
+        '''
+        batch_size = R.shape[0]
+        G_ = np.zeros((batch_size, 24, 4, 4), dtype=R.dtype)
+        G_[:, :, :3, :3] = R
+        G_[:, 0, :3, 3] = J[:, 0]
+        G_[:, 1:, :3, 3] = J[:, 1:] - J[:, self.parent]
+        G_[:, :, 3, 3] = 1
+        G_ = G_[:, self.level_joints]
+        G = [G_[:, :1]]
+        start = 1
+        for size in self.level_sizes[1:]:
+            parents = self.level_parents[start - 1:start - 1 + size]
+            G.append(np.matmul(G[-1][:, parents], G_[:, start:start + size]))
+            start += size
+        return np.concatenate(G, axis=1)[:, self.level_inverse]
+
+    def linear_blend_skinning(self, G, v_posed):
+        '''
+            Poses the T-pose vertices with linear blend skinning
+        :param G: joint transforms relative to the rest pose - A batch size x 24 x 4 x 4 array
+        :param v_posed: batch size x 6890 x 3 vertices in T-pose
+        :return: batch size x 6890 x 3 posed vertices
+        '''
+        batch_size, num_verts = v_posed.shape[:2]
+        G = G[:, :, :3, :].transpose(1, 0, 2, 3).reshape(24, -1)
+        T = np.matmul(self.weights, G).reshape(num_verts, batch_size, 3, 4)
+        v_posed = v_posed.transpose(1, 0, 2)
+        # Summed column by column, faster than a batch of 3x3 matmuls in numpy
+        v = T[:, :, :, 3] + T[:, :, :, 0] * v_posed[:, :, None, 0] + T[:, :, :, 1] * v_posed[:, :, None, 1] + T[:, :, :, 2] * v_posed[:, :, None, 2]
+        return v.transpose(1, 0, 2)
+
+    def evaluate(self, pose, betas, trans, outputs):
+        '''
+            Evaluates only what the requested outputs depend on
+        :param pose: pose  parameters - A batch size x 72 array (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :param outputs: A sequence of STAROutput field names
+        :return: A STAROutput, the fields not requested are None
+        '''
+        for name in outputs:
+            if name not in STAROutput._fields:
+                raise RuntimeError('Invalid output %s' % (name))
+        pose, betas, trans = [np.asarray(x, dtype=self.dtype).reshape(-1, n) for x, n in [(pose, 72), (betas, self.num_betas), (trans, 3)]]
+        batch_size = pose.shape[0]
+        want_v = 'v' in outputs
+        want_v_posed = want_v or 'v_posed' in outputs
+        want_J_transformed = want_v or 'J_transformed' in outputs
+
+        v, v_posed, v_shaped, J_transformed = None, None, None, None
+        if want_v_posed or 'v_shaped' in outputs:
+            v_shaped, J = self.shape_blend_shapes(betas)
+        else:
+            J = self.joints_rest(betas)
+
+        if want_v_posed:
+            pose_quat = quat_feat(pose.reshape(-1, 3)).reshape(batch_size, -1)
+            pose_feat = np.concatenate((pose_quat[:, 4:], betas[:, 1:2]), 1)
+            v_posed = v_shaped + self.pose_blend_shapes(pose_feat)
+
+        if want_J_transformed:
+            R = rodrigues(pose.reshape(-1, 3)).reshape(batch_size, 24, 3, 3)
+            G = self.global_rigid_transformation(R, J)
+            J_transformed = G[:, :, :3, 3] + trans[:, None, :]
+
+        if want_v:
+            # Transforms relative to the rest pose, the rest joints are subtracted from the translation
+            G[:, :, :3, 3] -= np.matmul(G[:, :, :3, :3], J[:, :, :, None])[:, :, :, 0]
+            v = self.linear_blend_skinning(G, v_posed) + trans[:, None, :]
+
+        results = {'v': v, 'v_posed': v_posed, 'v_shaped': v_shaped, 'J': J, 'J_transformed': J_transformed}
+        return STAROutput(*[results[name] if name in outputs else None for name in STAROutput._fields])
+
+    def forward(self, pose, betas, trans, outputs=None):
+        '''
+            STAR forward pass given pose, betas (shape) and trans
+        :param pose: pose  parameters - A batch size x 72 array (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :param outputs: optional sequence of STAROutput field names, when given a STAROutput
+                        holding only these outputs is returned instead of the vertices
+        :return:
+                 v         : batch size x 6890 x 3
+                             The STAR model vertices, with the attributes v_posed, v_shaped,
+                             J_transformed and f as in the PyTorch backend
+        '''
+        if outputs is not None:
+            return self.evaluate(pose, betas, trans, outputs)
+        output = self.evaluate(pose, betas, trans, ('v', 'v_posed', 'v_shaped', 'J_transformed'))
+        v = output.v.view(STARVertices)
+        v.f = self.f
+        v.v_posed = output.v_posed
+        v.v_shaped = output.v_shaped
+        v.J_transformed = output.J_transformed
+        return v
+
+    __call__ = forward
+
+    def joints(self, pose, betas, trans):
+        '''
+            STAR posed joints given pose, betas (shape) and trans, the pose blend
+            shapes and the skinning of the vertices are not evaluated
+        :return: batch size x 24 x 3
+                 Posed model joints, the J_transformed of the forward pass.
+        '''
+        return self.evaluate(pose, betas, trans, ('J_transformed',)).J_transformed
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import numpy as np
+
+def quat_feat(theta):
+    '''
+        Computes a normalized quaternion ([0,0,0,0]  when the body is in rest pose)
+        given joint angles
+    :param theta: An array of joints axis angles, number of joints x 3
+    :return: number of joints x 4
+    '''
+    dtype = theta.dtype
+    if dtype == np.float16:
+        # The epsilon of the angle and the trigonometry need single precision
+        theta = theta.astype(np.float32)
+    angle = np.linalg.norm(theta + 1e-8, axis=1, keepdims=True)
+    normalized = theta / angle
+    angle = angle * 0.5
+    quat = np.concatenate([np.sin(angle) * normalized, np.cos(angle) - 1], axis=1)
+    return quat.astype(dtype, copy=False)
+
+def rodrigues(theta):
+    '''
+        Computes the rotation matrices given joint angles
+    :param theta: number of joints x 3
+    :return: number of joints x 3 x 3
+    '''
+    dtype = theta.dtype
+    if dtype == np.float16:
+        theta = theta.astype(np.float32)
+    angle = np.linalg.norm(theta + 1e-8, axis=1, keepdims=True)
+    normalized = theta / angle
+    angle = angle * 0.5
+    quat = np.concatenate([np.cos(angle), np.sin(angle) * normalized], axis=1)
+    quat = quat / np.linalg.norm(quat, axis=1, keepdims=True)
+    w, x, y, z = quat[:, 0], quat[:, 1], quat[:, 2], quat[:, 3]
+    w2, x2, y2, z2 = w * w, x * x, y * y, z * z
+    wx, wy, wz = w * x, w * y, w * z
+    xy, xz, yz = x * y, x * z, y * z
+    rot_mat = np.stack([w2 + x2 - y2 - z2, 2 * xy - 2 * wz, 2 * wy + 2 * xz,
+                        2 * wz + 2 * xy, w2 - x2 + y2 - z2, 2 * yz - 2 * wx,
+                        2 * xz - 2 * wy, 2 * wx + 2 * yz, w2 - x2 - y2 + z2], axis=1).reshape(-1, 3, 3)
+    return rot_mat.astype(dtype, copy=False)
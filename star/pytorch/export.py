@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import inspect
+import torch
+import torch.nn as nn
+from .star import STAR , STAROutput
+
+class STARExport(nn.Module):
+    '''
+        A STAR forward pass with tensor inputs and a tuple of tensor outputs, as traced by the exporters
+    '''
+    def __init__(self, model, outputs):
+        super(STARExport, self).__init__()
+        self.model = model
+        self.outputs = tuple(outputs)
+
+    def forward(self, pose, betas, trans):
+        output = self.model.evaluate(pose, betas, trans, self.outputs)
+        return tuple(getattr(output, name) for name in self.outputs)
+
+def export_onnx(gender, num_betas=10, path=None, outputs=('v', 'J_transformed'), dtype=None, opset_version=18):
+    '''
+        Exports the STAR forward pass to an ONNX graph with a dynamic batch dimension
+    :param gender: male, female or neutral
+    :param num_betas: number of shape parameters
+    :param path: output .onnx file, defaults to star_<gender>.onnx
+    :param outputs: the STAROutput field names the graph returns, in this order
+    :param dtype: data type of the model, defaults to cfg.data_type
+    :param opset_version: ONNX opset of the graph
+    :return: path of the written graph, its inputs are pose (batch size x 72), betas
+             (batch size x num_betas) and trans (batch size x 3)
+    '''
+    for name in outputs:
+        if name not in STAROutput._fields:
+            raise RuntimeError('Invalid output %s, expected one of %s' % (name, ', '.join(STAROutput._fields)))
+    if path is None:
+        path = 'star_%s.onnx' % (gender)
+
+    # The exporters trace dense tensors, the sparse pose blend shapes are not exportable
+    model = STAR(gender=gender, num_betas=num_betas, pose_blend='dense', skinning='dense', dtype=dtype)
+    module = STARExport(model, outputs).eval()
+    dtype = model.v_template.dtype
+    args = (torch.zeros(2, 72, dtype=dtype), torch.zeros(2, num_betas, dtype=dtype), torch.zeros(2, 3, dtype=dtype))
+    input_names = ['pose', 'betas', 'trans']
+
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        batch = torch.export.Dim('batch')
+        torch.onnx.export(module, args, path, input_names=input_names, output_names=list(outputs),
+                          dynamic_shapes={name: {0: batch} for name in input_names},
+                          opset_version=opset_version, dynamo=True)
+    else:
+        dynamic_axes = {name: {0: 'batch'} for name in input_names + list(outputs)}
+        torch.onnx.export(module, args, path, input_names=input_names, output_names=list(outputs),
+                          dynamic_axes=dynamic_axes, opset_version=opset_version)
+    return path
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import torch
+import torch.nn.functional as F
+from .utils import transform_points
+
+class BlendShapes(torch.autograd.Function):
+    '''
+        Adds the shape and pose blend shapes to the template, the blend shapes are linear
+        so the backward only multiplies the incoming gradient by the constant bases.
+    '''
+    @staticmethod
+    def forward(ctx, betas, pose_feat, v_template, shapedirs, posedirs, posedirs_sparse=None):
+        '''
+        :param betas: batch size x number of betas
+        :param pose_feat: batch size x 93 pose features
+        :param v_template: number of vertices x 3 template
+        :param shapedirs: (number of vertices * 3) x number of betas shape basis
+        :param posedirs: (number of vertices * 3) x 93 pose basis
+        :param posedirs_sparse: optional CSR copy of posedirs used for the forward
+        :return: batch size x number of vertices x 3 vertices in T-pose
+        '''
+        ctx.save_for_backward(shapedirs, posedirs)
+        if posedirs_sparse is not None:
+            pose_offsets = torch.sparse.mm(posedirs_sparse, pose_feat.t()).t()
+        else:
+            pose_offsets = torch.matmul(pose_feat, posedirs.t())
+        v_posed = torch.addmm(pose_offsets, betas, shapedirs.t())
+        return v_posed.view(betas.shape[0], -1, 3) + v_template[None, :]
+
+    @staticmethod
+    def backward(ctx, grad_v_posed):
+        shapedirs, posedirs = ctx.saved_tensors
+        grad = grad_v_posed.reshape(grad_v_posed.shape[0], -1)
+        grad_betas = torch.matmul(grad, shapedirs) if ctx.needs_input_grad[0] else None
+        grad_pose_feat = torch.matmul(grad, posedirs) if ctx.needs_input_grad[1] else None
+        return grad_betas, grad_pose_feat, None, None, None, None
+
+class LinearBlendSkinning(torch.autograd.Function):
+    '''
+        Linear blend skinning that only keeps the joint transforms and the T-pose vertices
+        for the backward, the per vertex blended transforms are recomputed instead of stored.
+    '''
+    @staticmethod
+    def forward(ctx, G, v_posed, weights):
+        '''
+        :param G: joint transforms relative to the rest pose - A batch size x 24 x 4 x 4 tensor
+        :param v_posed: batch size x number of vertices x 3 vertices in T-pose
+        :param weights: number of vertices x 24 skinning weights
+        :return: batch size x number of vertices x 3 posed vertices
+        '''
+        ctx.save_for_backward(G, v_posed, weights)
+        T = LinearBlendSkinning.blend(G, weights)
+        return transform_points(T, v_posed.transpose(0, 1)).transpose(0, 1)
+
+    @staticmethod
+    def blend(G, weights):
+        # The top 3x4 part of the transforms blended per vertex - number of vertices x batch size x 3 x 4
+        batch_size = G.shape[0]
+        G = G[:, :, :3, :].permute(1, 0, 2, 3).reshape(24, -1)
+        return torch.matmul(weights, G).view(weights.shape[0], batch_size, 3, 4)
+
+    @staticmethod
+    def backward(ctx, grad_v):
+        G, v_posed, weights = ctx.saved_tensors
+        grad_G, grad_v_posed = None, None
+        if ctx.needs_input_grad[1]:
+            T = LinearBlendSkinning.blend(G, weights)
+            # The transposed rotation part applied to the gradient, column by column
+            grad = grad_v.transpose(0, 1)
+            grad_v_posed = (T[:, :, 0, :3] * grad[:, :, 0, None] + T[:, :, 1, :3] * grad[:, :, 1, None] + T[:, :, 2, :3] * grad[:, :, 2, None]).transpose(0, 1)
+            del T
+        if ctx.needs_input_grad[0]:
+            batch_size, num_verts = v_posed.shape[:2]
+            rest_shape_h = F.pad(v_posed, (0, 1), value=1.0)
+            grad_T = (grad_v[:, :, :, None] * rest_shape_h[:, :, None, :]).transpose(0, 1).reshape(num_verts, -1)
+            grad_G = torch.matmul(weights.t(), grad_T).view(24, batch_size, 3, 4).permute(1, 0, 2, 3)
+            grad_G = F.pad(grad_G, (0, 0, 0, 1))
+        return grad_G, grad_v_posed, None
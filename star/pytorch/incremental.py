@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import torch
+import torch.nn.functional as F
+from .star import STAROutput
+from .utils import rodrigues , quat_feat , transform_points
+from .functions import LinearBlendSkinning
+from ..config import meta
+
+class STARIncremental(object):
+    '''
+        Evaluates a STAR model for parameters that change a few at a time, as in interactive
+        editing, by keeping the intermediates of the previous evaluation:
+            trans only changes            : the translation is added to the cached posed vertices
+            betas unchanged               : the shape blend shapes and the rest joints are reused
+            some joint angles changed     : only the transforms of their subtrees are composed again,
+                                            the pose blend shapes of these joints are updated and only
+                                            the vertices they influence are skinned again
+        The skinning uses the dense skinning weights of the model and no gradients are recorded.
+    '''
+    def __init__(self, model):
+        '''
+        :param model: A STAR model
+        '''
+        self.model = model
+        parent = [-1] + model.parent.tolist()
+        # Joints of the subtree rooted at each joint, a row per joint
+        self.subtree = torch.eye(24, dtype=torch.bool)
+        for joint in model.level_joints.tolist():
+            if parent[joint] >= 0:
+                self.subtree[:, joint] |= self.subtree[:, parent[joint]]
+        # Vertices skinned by each joint, and vertices moved by the pose blend shapes of each joint
+        self.joint_vertices = (model.weights != 0).t().cpu()
+        pose_vertices = (model.posedirs.view(-1, 3, 93) != 0).any(dim=1)[:, :92].view(-1, 23, 4).any(dim=2).t().cpu()
+        self.pose_vertices = torch.cat([torch.zeros_like(pose_vertices[:1]), pose_vertices])
+        self.level_joints = [joints.tolist() for joints in torch.split(model.level_joints, model.level_sizes)]
+        self.parent = parent
+        self.plans = {}
+        self.reset()
+
+    def reset(self):
+        '''
+            Discards the cached evaluation, the next update evaluates the model fully
+        '''
+        self.pose, self.betas, self.trans = None, None, None
+        self.v_shaped, self.J, self.pose_feat, self.v_posed = None, None, None, None
+        self.R, self.G, self.v_local = None, None, None
+
+    def relative(self, G):
+        # Transforms relative to the rest pose
+        return G - F.pad(torch.matmul(G[:, :, :3, :3], self.J[:, :, :, None]), (3, 0, 0, 1))
+
+    def skin(self, G, weights, v_posed):
+        T = LinearBlendSkinning.blend(G, weights)
+        return transform_points(T, v_posed.transpose(0, 1)).transpose(0, 1)
+
+    def evaluate(self, pose, betas, shape=True):
+        model = self.model
+        batch_size = pose.shape[0]
+        if shape:
+            self.v_shaped, self.J = model.shape_blend_shapes(betas)
+        pose_quat = quat_feat(pose.view(-1, 3)).view(batch_size, -1)
+        self.pose_feat = torch.cat((pose_quat[:, 4:], betas[:, 1:2]), 1)
+        self.v_posed = self.v_shaped + model.pose_blend_shapes(self.pose_feat)
+        self.R = rodrigues(pose.view(-1, 3)).view(batch_size, 24, 3, 3)
+        self.G = model.global_rigid_transformation(self.R, self.J)
+        self.v_local = self.skin(self.relative(self.G), model.weights, self.v_posed)
+
+    def plan(self, joints):
+        '''
+            The joints, vertices and model data that a change of the angles of the given joints
+            touches, built once per set of joints
+        '''
+        if joints not in self.plans:
+            model = self.model
+            device = model.v_template.device
+            plan = meta()
+            subtree = self.subtree[list(joints)].any(dim=0)
+            # The whole mesh moves with the root, it is evaluated like the first update
+            plan.full = bool(subtree.all())
+            plan.levels = []
+            for level in self.level_joints:
+                level = [joint for joint in level if subtree[joint]]
+                if len(level) > 0:
+                    parents = [max(self.parent[joint], 0) for joint in level]
+                    plan.levels.append((torch.tensor(level, device=device), torch.tensor(parents, device=device), self.parent[level[0]] >= 0))
+            plan.joints = torch.tensor(joints, device=device)
+            # Pose features and pose blend shapes rows of the joints, the root has none
+            pose_joints = [joint for joint in joints if joint > 0]
+            plan.columns = torch.tensor([4 * (joint - 1) + i for joint in pose_joints for i in range(4)], dtype=torch.long, device=device)
+            pose_mask = self.pose_vertices[pose_joints].any(dim=0)
+            pose_ids = torch.nonzero(pose_mask)[:, 0].to(device)
+            plan.rows = (3 * pose_ids[:, None] + torch.arange(3, device=device)[None, :]).view(-1)
+            plan.posedirs = model.posedirs[plan.rows][:, plan.columns]
+            # Vertices skinned by the subtree or moved by the pose blend shapes
+            plan.vertex_ids = torch.nonzero(self.joint_vertices[subtree].any(dim=0) | pose_mask)[:, 0].to(device)
+            plan.weights = model.weights[plan.vertex_ids]
+            self.plans[joints] = plan
+        return self.plans[joints]
+
+    def evaluate_joints(self, pose, joints):
+        '''
+            Evaluates again the intermediates depending on the angles of the given joints
+        '''
+        plan = self.plan(tuple(joints))
+        if plan.full:
+            return self.evaluate(pose, self.betas, shape=False)
+        batch_size = pose.shape[0]
+
+        # The pose blend shapes are linear, the change of the features of the joints is added
+        pose_quat = quat_feat(pose.view(-1, 3)).view(batch_size, -1)
+        pose_feat = torch.cat((pose_quat[:, 4:], self.pose_feat[:, 92:]), 1)
+        v_posed = self.v_posed.clone()
+        if len(plan.rows) > 0:
+            delta = pose_feat[:, plan.columns] - self.pose_feat[:, plan.columns]
+            v_posed.view(batch_size, -1)[:, plan.rows] += torch.matmul(delta, plan.posedirs.t())
+        self.pose_feat, self.v_posed = pose_feat, v_posed
+
+        # Transforms of the subtrees of the changed joints, composed level by level
+        R = self.R.clone()
+        R[:, plan.joints] = rodrigues(pose.view(batch_size, 24, 3)[:, plan.joints].reshape(-1, 3)).view(batch_size, -1, 3, 3)
+        self.R = R
+        G = self.G.clone()
+        for level, parents, has_parent in plan.levels:
+            t = self.J[:, level] - self.J[:, parents] if has_parent else self.J[:, level]
+            G_ = F.pad(torch.cat([R[:, level], t[:, :, :, None]], dim=-1), (0, 0, 0, 1))
+            G_[:, :, 3, 3] = 1
+            G[:, level] = torch.matmul(G[:, parents], G_) if has_parent else G_
+        self.G = G
+
+        v_local = self.v_local.clone()
+        v_local[:, plan.vertex_ids] = self.skin(self.relative(G), plan.weights, v_posed[:, plan.vertex_ids])
+        self.v_local = v_local
+
+    def update(self, pose=None, betas=None, trans=None):
+        '''
+            Evaluates the model for new parameters, the parameters left to None keep their previous value
+        :param pose: pose  parameters - A batch size x 72 tensor (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :return: A STAROutput holding v, v_posed, v_shaped, J and J_transformed
+        '''
+        pose = self.pose if pose is None else pose
+        betas = self.betas if betas is None else betas
+        trans = self.trans if trans is None else trans
+        if pose is None or betas is None or trans is None:
+            raise RuntimeError('The first update needs the pose, betas and trans')
+
+        with torch.no_grad():
+            if self.v_local is None or betas.shape != self.betas.shape or pose.shape != self.pose.shape \
+                    or not torch.equal(betas, self.betas):
+                self.evaluate(pose, betas)
+            elif not torch.equal(pose, self.pose):
+                changed = (pose.view(pose.shape[0], 24, 3) != self.pose.view(pose.shape[0], 24, 3)).any(dim=2).any(dim=0)
+                self.evaluate_joints(pose, torch.nonzero(changed)[:, 0].tolist())
+            self.pose, self.betas, self.trans = pose.clone(), betas.clone(), trans.clone()
+            v = self.v_local + trans[:, None, :]
+            J_transformed = self.G[:, :, :3, 3] + trans[:, None, :]
+        return STAROutput(v, self.v_posed, self.v_shaped, self.J, J_transformed)
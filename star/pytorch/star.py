@@ -22,17 +22,77 @@
 from __future__ import division
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 import os 
+import warnings
+import weakref
+from collections import OrderedDict , namedtuple
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
-from .utils import rodrigues , quat_feat , with_zeros
-from ..config import cfg 
+from .utils import rodrigues , quat_feat , transform_points
+from .functions import BlendShapes , LinearBlendSkinning
+from ..config import cfg , meta
+from ..assets import load_model , kinematic_levels , check_precision , private_mapping
+
+# The outputs of a STAR evaluation
+#   v            : batch size x 6890 x 3 posed vertices
+#   v_posed      : batch size x 6890 x 3 T-pose vertices with the shape and pose blend shapes
+#   v_shaped     : batch size x 6890 x 3 T-pose vertices with the shape blend shapes
+#   J            : batch size x 24 x 3 rest pose joints
+#   J_transformed: batch size x 24 x 3 posed joints
+STAROutput = namedtuple('STAROutput', ['v', 'v_posed', 'v_shaped', 'J', 'J_transformed'])
+
+# Model tensors shared by all the STAR instances of the process, an entry lives as long as a model uses it
+_shared_tensors = weakref.WeakValueDictionary()
+
+
+def shared_tensor(path_model, name, array, dtype, device):
+    '''
+        Converts a model array to a tensor once per process, data type and device
+    :param path_model: path of the model the array belongs to
+    :param name: name of the array in the model
+    :param array: A numpy array
+    :return: A tensor shared by all the models using the same array, it must not be modified in place,
+             STAR.load_state_dict replaces such buffers instead of writing into them
+    '''
+    key = (path_model, name, array.shape, dtype, str(torch.device(device)))
+    tensor = _shared_tensors.get(key)
+    # A tensor written in place is left to the models holding it, the new models get a new one
+    if tensor is None or tensor._version != tensor.shared_version:
+        mapping = None
+        if str(torch.device(device)) == 'cpu' and dtype != torch.bfloat16 and torch.empty(0, dtype=dtype).numpy().dtype == array.dtype:
+            mapping = private_mapping(array)
+        if mapping is not None:
+            # Memory mapped arrays of the right type are used in place, through a copy on write
+            # mapping of their own so that a write to the tensor does not reach the model arrays
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                tensor = torch.from_numpy(mapping)
+        else:
+            tensor = torch.tensor(array, dtype=dtype, device=device)
+        tensor.shared_version = tensor._version
+        _shared_tensors[key] = tensor
+    return tensor
+
+# The compiled STAR._evaluate, shared by the compiled models. The models do not hold it, a
+# compiled function can not be pickled and would stay bound to the model it was copied from
+_compiled_evaluate = None
+
+
+def compiled_evaluate():
+    global _compiled_evaluate
+    if _compiled_evaluate is None:
+        _compiled_evaluate = torch.compile(STAR._evaluate)
+    return _compiled_evaluate
 
 
 class STAR(nn.Module):
+    # Number of workspaces kept, see STAR.workspace
+    max_workspaces = 4
+
     # def __init__(self,gender='female',num_betas=10,device='cpu'):
     #     super(STAR, self).__init__()
 
@@ -82,12 +142,42 @@ class STAR(nn.Module):
     #     self.J = None
     #     self.R = None
     
-    def __init__(self, gender='female', num_betas=10, device='cpu'):
+    def __init__(self, gender='female', num_betas=10, device='cpu', pose_blend='dense', skinning='dense', skinning_topk=None, cache_size=0, compile=False, dtype=None, gradients='autograd', workspace=False):
         super(STAR, self).__init__()
 
         if gender not in ['male', 'female', 'neutral']:
             raise RuntimeError('Invalid Gender')
 
+        if pose_blend not in ['sparse', 'dense']:
+            raise RuntimeError('Invalid pose blend mode %s' % (pose_blend))
+
+        if skinning not in ['sparse', 'dense']:
+            raise RuntimeError('Invalid skinning mode %s' % (skinning))
+
+        if gradients not in ['autograd', 'analytic']:
+            raise RuntimeError('Invalid gradients mode %s' % (gradients))
+
+        if dtype is None:
+            dtype = cfg.data_type
+        if isinstance(dtype, str):
+            dtype = getattr(torch, dtype, None)
+        if dtype not in [torch.float16, torch.bfloat16, torch.float32, torch.float64]:
+            raise RuntimeError('Invalid data type %s' % (dtype))
+
+        if compile and not hasattr(torch, 'compile'):
+            raise RuntimeError('Compiling the model requires PyTorch 2.0 or newer')
+
+        # Sparse tensors can not be captured in a compiled graph
+        if compile:
+            pose_blend = 'dense'
+            # The compiled graph plans its own buffers
+            workspace = False
+
+        # The analytic backward of the skinning differentiates the dense skinning weights
+        self.gradients = gradients
+        if gradients == 'analytic':
+            skinning = 'dense'
+
         if gender == 'male':
             path_model = cfg.path_male_star
         elif gender == 'female':
@@ -99,51 +189,531 @@ class STAR(nn.Module):
             raise RuntimeError('Path does not exist %s' % (path_model))
         
         import numpy as np
-        star_model = np.load(path_model, allow_pickle=True)
+        star_model = load_model(path_model)
+        check_precision(path_model, star_model, str(dtype).replace('torch.', ''))
         J_regressor = star_model['J_regressor']
         rows, cols = np.where(J_regressor != 0)
         vals = J_regressor[rows, cols]
         self.num_betas = num_betas
 
         # Model sparse joints regressor, regresses joints location from a mesh
-        self.register_buffer('J_regressor', torch.tensor(J_regressor, dtype=torch.float32, device=device))
+        self.register_buffer('J_regressor', shared_tensor(path_model, 'J_regressor', J_regressor, dtype, device))
 
         # Model skinning weights
-        self.register_buffer('weights', torch.tensor(star_model['weights'], dtype=torch.float32, device=device))
+        self.register_buffer('weights', shared_tensor(path_model, 'weights', star_model['weights'], dtype, device))
+
+        # Each vertex is only influenced by a handful of joints, the sparse skinning keeps the top k of them per vertex
+        self.skinning = skinning
+        self.skinning_topk = skinning_topk
+        if skinning == 'sparse' and skinning_topk is None and 'skinning_joints' in star_model:
+            self.register_buffer('skinning_weights', shared_tensor(path_model, 'skinning_weights', star_model['skinning_weights'], dtype, device), persistent=False)
+            self.register_buffer('skinning_joints', shared_tensor(path_model, 'skinning_joints', star_model['skinning_joints'], torch.int64, device), persistent=False)
+        elif skinning == 'sparse':
+            self.set_skinning_topk()
 
         # Model pose corrective blend shapes
-        self.register_buffer('posedirs', torch.tensor(star_model['posedirs'].reshape((-1, 93)), dtype=torch.float32, device=device))
+        self.register_buffer('posedirs', shared_tensor(path_model, 'posedirs', star_model['posedirs'].reshape((-1, 93)), dtype, device))
+
+        # The pose correctives are spatially local, pose_blend='sparse' stores and evaluates only the non zero
+        # entries. It pays off for large batches only, the sparse kernel overhead dominates small ones.
+        # The module keeps the dense CSR arrays, sparse tensors can not be deep copied or pickled. The
+        # indices are 32 bit, the sparse kernels would otherwise convert them on every call
+        self.pose_blend = pose_blend
+        if pose_blend == 'sparse':
+            if 'posedirs_indptr' in star_model:
+                self.register_buffer('posedirs_indptr', shared_tensor(path_model, 'posedirs_indptr', star_model['posedirs_indptr'], torch.int32, device), persistent=False)
+                self.register_buffer('posedirs_indices', shared_tensor(path_model, 'posedirs_indices', star_model['posedirs_indices'], torch.int32, device), persistent=False)
+                self.register_buffer('posedirs_data', shared_tensor(path_model, 'posedirs_data', star_model['posedirs_data'], dtype, device), persistent=False)
+            else:
+                self.set_posedirs_csr(self)
 
         # Mean Shape
-        self.register_buffer('v_template', torch.tensor(star_model['v_template'], dtype=torch.float32, device=device))
+        self.register_buffer('v_template', shared_tensor(path_model, 'v_template', star_model['v_template'], dtype, device))
 
-        # Shape corrective blend shapes
-        self.register_buffer('shapedirs', torch.tensor(np.array(star_model['shapedirs'][:, :, :num_betas]), dtype=torch.float32, device=device))
+        # Shape corrective blend shapes, a 6890 x 3 x num_betas view of a betas major tensor, the
+        # compiled models store this layout so that the first betas are used without a copy
+        shapedirs = np.ascontiguousarray(star_model['shapedirs'].transpose(2, 0, 1)[:num_betas])
+        self.register_buffer('shapedirs', shared_tensor(path_model, 'shapedirs', shapedirs, dtype, device).permute(1, 2, 0))
+
+        # The joints are linear in the betas, they are regressed once from the template and the shape blend shapes
+        if 'J_template' in star_model:
+            self.register_buffer('J_template', torch.tensor(star_model['J_template'], dtype=dtype, device=device), persistent=False)
+            self.register_buffer('J_shapedirs', torch.tensor(star_model['J_shapedirs'][:, :, :num_betas], dtype=dtype, device=device), persistent=False)
+        else:
+            self.set_joints_basis()
 
         # Mesh triangles
-        self.register_buffer('faces', torch.from_numpy(star_model['f'].astype(np.int64)))
+        self.register_buffer('faces', shared_tensor(path_model, 'f', star_model['f'], torch.int64, 'cpu'))
 
         self.f = star_model['f']
 
         # Kinematic tree of the model
-        self.register_buffer('kintree_table', torch.from_numpy(star_model['kintree_table'].astype(np.int64)))
+        self.register_buffer('kintree_table', shared_tensor(path_model, 'kintree_table', star_model['kintree_table'], torch.int64, 'cpu'))
+
+        if 'parent' in star_model:
+            self.register_buffer('parent', torch.LongTensor(star_model['parent'].tolist()))
+        else:
+            id_to_col = {self.kintree_table[1, i].item(): i for i in range(self.kintree_table.shape[1])}
+            self.register_buffer('parent', torch.LongTensor(
+                [id_to_col[self.kintree_table[0, it].item()] for it in range(1, self.kintree_table.shape[1])]))
+
+        # Joints grouped by depth in the kinematic tree, each depth level is composed with a single matmul
+        if 'level_joints' in star_model:
+            level_joints, level_parents, self.level_sizes = [star_model[name].tolist() for name in ['level_joints', 'level_parents', 'level_sizes']]
+        else:
+            level_joints, level_parents, self.level_sizes = kinematic_levels(self.parent.tolist())
+        self.register_buffer('level_joints', torch.LongTensor(level_joints), persistent=False)
+        self.register_buffer('level_parents', torch.LongTensor(level_parents), persistent=False)
+        self.register_buffer('level_inverse', torch.argsort(self.level_joints), persistent=False)
+        # The position of the parent of every non root joint in the depth order
+        offsets = np.cumsum([0] + list(self.level_sizes))
+        level_depths = np.repeat(np.arange(1, len(self.level_sizes)), self.level_sizes[1:])
+        self.register_buffer('level_parent_positions', torch.LongTensor((offsets[level_depths - 1] + np.asarray(level_parents, dtype=np.int64)).tolist()), persistent=False)
+
+        # Least recently used cache of the shaped vertices and rest joints, keyed on the betas of a single body
+        self.cache_size = cache_size
+        self.shape_cache = OrderedDict()
+
+        # Model buffers sliced to the vertex subsets that were evaluated
+        self.vertex_subsets = {}
+
+        # Homogeneous row of the 4x4 joint transforms
+        self.register_buffer('pad_row', torch.tensor([0, 0, 0, 1], dtype=dtype, device=device), persistent=False)
 
-        id_to_col = {self.kintree_table[1, i].item(): i for i in range(self.kintree_table.shape[1])}
-        self.register_buffer('parent', torch.LongTensor(
-            [id_to_col[self.kintree_table[0, it].item()] for it in range(1, self.kintree_table.shape[1])]))
+        # Least recently used scratch tensors reused across the calls, keyed on the batch size, device,
+        # data type and inference mode
+        self.use_workspace = workspace
+        self.workspaces = OrderedDict()
 
         self.verts = None
         self.J = None
         self.R = None
 
+        # Only evaluate is compiled, forward attaches the legacy attributes to its result in eager mode
+        self.use_compile = compile
+
+
+    def _apply(self, fn):
+        # Cached tensors do not follow the module across devices and data types
+        self.shape_cache.clear()
+        self.vertex_subsets.clear()
+        self.workspaces.clear()
+        return super(STAR, self)._apply(fn)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+        # The buffers may share their storage with the other models of the process and with the
+        # model arrays, the loaded values are copied into private copies of them instead
+        for name, buffer in self._buffers.items():
+            if buffer is not None and prefix + name in state_dict:
+                self._buffers[name] = buffer.clone()
+        self.shape_cache.clear()
+        self.vertex_subsets.clear()
+        super(STAR, self)._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+        # The buffers derived from the loaded ones are rebuilt
+        if self.pose_blend == 'sparse' and prefix + 'posedirs' in state_dict:
+            self.set_posedirs_csr(self)
+        if self.skinning == 'sparse' and prefix + 'weights' in state_dict:
+            self.set_skinning_topk()
+        if any(prefix + name in state_dict for name in ['J_regressor', 'v_template', 'shapedirs']):
+            self.set_joints_basis()
+
+    def set_skinning_topk(self):
+        '''
+            Sets the top k skinning weights of every vertex and their joints from the skinning weights,
+            the weights are renormalized when k is below the number of joints influencing a vertex
+        '''
+        max_influences = int((self.weights != 0).sum(dim=1).max())
+        skinning_topk = max_influences if self.skinning_topk is None else self.skinning_topk
+        skinning_weights, skinning_joints = torch.topk(self.weights, min(skinning_topk, 24), dim=1)
+        if skinning_topk < max_influences:
+            skinning_weights = skinning_weights / skinning_weights.sum(dim=1, keepdim=True)
+        self.register_buffer('skinning_weights', skinning_weights, persistent=False)
+        self.register_buffer('skinning_joints', skinning_joints, persistent=False)
+
+    def set_joints_basis(self):
+        '''
+            Regresses the rest joints of the template and the joint shape basis from the
+            template and the shape blend shapes, in double precision
+        '''
+        J_regressor = self.J_regressor.double()
+        J_template = torch.matmul(J_regressor, self.v_template.double())
+        J_shapedirs = torch.einsum('ji,ikl->jkl', J_regressor, self.shapedirs.double())
+        self.register_buffer('J_template', J_template.to(self.v_template.dtype), persistent=False)
+        self.register_buffer('J_shapedirs', J_shapedirs.to(self.v_template.dtype), persistent=False)
+
+    def vertex_subset(self, vertex_ids=None):
+        '''
+            The per vertex model buffers restricted to a subset of the vertices,
+            sliced once per vertex subset
+        :param vertex_ids: A sequence of vertex indices, None for all the vertices
+        :return: An object holding the sliced v_template, shapedirs, posedirs and
+                 skinning weights buffers
+        '''
+        if vertex_ids is None:
+            return self
+        key = tuple(int(i) for i in vertex_ids)
+        if key not in self.vertex_subsets:
+            ids = torch.tensor(key, dtype=torch.long, device=self.v_template.device)
+            rows = (3 * ids[:, None] + torch.arange(3, device=ids.device)[None, :]).view(-1)
+            subset = meta()
+            subset.v_template = self.v_template[ids]
+            subset.shapedirs = self.shapedirs.permute(2, 0, 1)[:, ids].permute(1, 2, 0)
+            subset.posedirs = self.posedirs[rows]
+            subset.weights = self.weights[ids]
+            if self.pose_blend == 'sparse':
+                self.set_posedirs_csr(subset)
+            if self.skinning == 'sparse':
+                subset.skinning_weights = self.skinning_weights[ids]
+                subset.skinning_joints = self.skinning_joints[ids]
+            self.vertex_subsets[key] = subset
+        return self.vertex_subsets[key]
+
+    @staticmethod
+    def set_posedirs_csr(buffers):
+        '''
+            Sets the CSR arrays of the posedirs of a model or of a vertex subset
+        '''
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            posedirs_sparse = buffers.posedirs.to_sparse_csr()
+        arrays = {'posedirs_indptr': posedirs_sparse.crow_indices().int(), 'posedirs_indices': posedirs_sparse.col_indices().int(),
+                  'posedirs_data': posedirs_sparse.values().clone()}
+        for name, array in arrays.items():
+            if isinstance(buffers, nn.Module):
+                buffers.register_buffer(name, array, persistent=False)
+            else:
+                setattr(buffers, name, array)
+
+    def posedirs_sparse(self, vertex_ids=None):
+        '''
+            The pose blend shapes as a CSR matrix, assembled from the CSR arrays on every call
+        :param vertex_ids: optional subset of the vertices
+        :return: (number of vertices * 3) x 93 sparse CSR tensor
+        '''
+        buffers = self.vertex_subset(vertex_ids)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return torch.sparse_csr_tensor(buffers.posedirs_indptr, buffers.posedirs_indices, buffers.posedirs_data,
+                                           size=tuple(buffers.posedirs.shape))
+
+    def workspace(self, batch_size, device, dtype):
+        '''
+            Scratch tensors of the calls with a given batch size, device and data type, they are
+            overwritten by the next such call. Only the max_workspaces most recently used
+            workspaces are kept. The joint tensors are joint major so that a depth
+            level of the kinematic tree is a contiguous block the matmuls write to
+        :return: An object holding
+                 R, J    : batch size x 24 x 3 x 3 rotations and 24 x 3 rest joints in depth order
+                 J_parent: batch size x 23 x 3 rest joints of the parents of the non root joints
+                 G_      : 24 x batch size x 4 x 4 local joint transforms in depth order, with their
+                           homogeneous row set
+                 P       : 23 x batch size x 4 x 4 global transforms of the parents
+                 G       : 24 x batch size x 4 x 4 global joint transforms in depth order
+                 G_global: 24 x batch size x 4 x 4 global joint transforms
+                 A       : 24 x batch size x 3 x 4 joint transforms relative to the rest pose
+                 T       : per number of vertices, the blended 3 x 4 vertex transforms of the dense skinning
+        '''
+        # Tensors created in inference mode can not be updated outside of it
+        key = (batch_size, str(device), dtype, torch.is_inference_mode_enabled())
+        if key not in self.workspaces:
+            workspace = meta()
+            workspace.R = torch.empty(batch_size, 24, 3, 3, dtype=dtype, device=device)
+            workspace.J = torch.empty(batch_size, 24, 3, dtype=dtype, device=device)
+            workspace.J_parent = torch.empty(batch_size, 23, 3, dtype=dtype, device=device)
+            workspace.G_ = torch.zeros(24, batch_size, 4, 4, dtype=dtype, device=device)
+            workspace.G_[:, :, 3, 3] = 1
+            workspace.P = torch.empty(23, batch_size, 4, 4, dtype=dtype, device=device)
+            workspace.G = torch.empty(24, batch_size, 4, 4, dtype=dtype, device=device)
+            workspace.G_global = torch.empty(24, batch_size, 4, 4, dtype=dtype, device=device)
+            workspace.A = torch.empty(24, batch_size, 3, 4, dtype=dtype, device=device)
+            workspace.T = {}
+            self.workspaces[key] = workspace
+            while len(self.workspaces) > self.max_workspaces:
+                self.workspaces.popitem(last=False)
+        self.workspaces.move_to_end(key)
+        return self.workspaces[key]
 
-    def forward(self, pose, betas , trans):
+    def shape_basis(self, vertex_ids=None):
+        '''
+        :param vertex_ids: optional subset of the vertices
+        :return: num_betas x (number of vertices * 3) view of the shape blend shapes
+        '''
+        return self.vertex_subset(vertex_ids).shapedirs.permute(2, 0, 1).reshape(self.num_betas, -1)
+
+    def _shape_blend_shapes(self, betas, vertex_ids=None):
+        buffers = self.vertex_subset(vertex_ids)
+        v_shaped = torch.matmul(betas, self.shape_basis(vertex_ids)).view(betas.shape[0], -1, 3) + buffers.v_template[None, :]
+        return v_shaped, self.joints_rest(betas)
+
+    def joints_rest(self, betas):
+        '''
+            Regresses the rest pose joints from the joint shape basis
+        :param betas: beta parameters - A batch size x number of betas
+        :return: batch size x 24 x 3 rest joints
+        '''
+        return torch.matmul(betas, self.J_shapedirs.view(-1, self.num_betas).t()).view(-1, 24, 3) + self.J_template[None, :]
+
+    def shape_blend_shapes(self, betas, vertex_ids=None):
+        '''
+            Evaluates the shaped T-pose vertices and the rest joints, the betas
+            seen recently are served from the cache when it is enabled
+        :param betas: beta parameters - A batch size x number of betas
+        :param vertex_ids: optional subset of the vertices to evaluate
+        :return:
+                 v_shaped: batch size x 6890 x 3 vertices after adding the shape blend shapes
+                 J       : batch size x 24 x 3 rest joints
+        '''
+        if self.cache_size == 0 or betas.requires_grad or vertex_ids is not None:
+            return self._shape_blend_shapes(betas, vertex_ids)
+
+        keys = [(str(betas.device), str(betas.dtype), row.tobytes()) for row in betas.detach().cpu().numpy()]
+        entries = {}
+        for key in keys:
+            if key in self.shape_cache:
+                self.shape_cache.move_to_end(key)
+                entries[key] = self.shape_cache[key]
+        missing = [i for i, key in enumerate(keys) if key not in entries]
+        if len(missing) > 0:
+            v_shaped, J = self._shape_blend_shapes(betas[missing])
+            for n, i in enumerate(missing):
+                entries[keys[i]] = (v_shaped[n].clone(), J[n].clone())
+                self.shape_cache[keys[i]] = entries[keys[i]]
+        while len(self.shape_cache) > self.cache_size:
+            self.shape_cache.popitem(last=False)
+
+        v_shaped = torch.stack([entries[key][0] for key in keys])
+        J = torch.stack([entries[key][1] for key in keys])
+        return v_shaped, J
+
+    def pose_blend_shapes(self, pose_feat, vertex_ids=None):
+        '''
+            Evaluates the pose corrective blend shapes
+        :param pose_feat: pose features - A batch size x 93 tensor
+        :param vertex_ids: optional subset of the vertices to evaluate
+        :return: batch size x 6890 x 3 vertex offsets
+        '''
+        buffers = self.vertex_subset(vertex_ids)
+        # The sparse kernels do not support half precision on the CPU
+        if self.pose_blend == 'sparse' and (pose_feat.is_cuda or pose_feat.dtype in [torch.float32, torch.float64]):
+            pose_offsets = torch.sparse.mm(self.posedirs_sparse(vertex_ids), pose_feat.t()).t()
+        else:
+            pose_offsets = torch.matmul(pose_feat, buffers.posedirs.t())
+        return pose_offsets.reshape(pose_feat.shape[0], -1, 3)
+
+    def global_rigid_transformation(self, R, J):
+        '''
+            Composes the joint transforms along the kinematic tree
+        :param R: batch size x 24 x 3 x 3 joint rotations
+        :param J: batch size x 24 x 3 rest pose joint locations
+        :return: batch size x 24 x 4 x 4 global joint transforms
+        '''
+        batch_size = R.shape[0]
+        J_ = J.clone()
+        J_[:, 1:, :] = J[:, 1:, :] - J[:, self.parent, :]
+        G_ = torch.cat([R, J_[:, :, :, None]], dim=-1)
+        pad_row = self.pad_row.view(1, 1, 1, 4).expand(batch_size, 24, -1, -1)
+        G_ = torch.cat([G_, pad_row], dim=2)
+        G_ = G_[:, self.level_joints]
+        G = [G_[:, :1]]
+        start = 1
+        for size in self.level_sizes[1:]:
+            parents = self.level_parents[start - 1:start - 1 + size]
+            G.append(torch.matmul(G[-1][:, parents], G_[:, start:start + size]))
+            start += size
+        return torch.cat(G, dim=1)[:, self.level_inverse]
+
+    def _transforms_workspace(self, R, J, workspace):
+        '''
+            The global and relative joint transforms of global_rigid_transformation and evaluate,
+            written to the scratch tensors of a workspace
+        :param R: batch size x 24 x 3 x 3 joint rotations
+        :param J: batch size x 24 x 3 rest pose joint locations
+        :return: batch size x 24 x 4 x 4 global joint transforms and batch size x 24 x 3 x 4 joint
+                 transforms relative to the rest pose, views of the workspace
+        '''
+        G_, G, P = workspace.G_, workspace.G, workspace.P
+        torch.index_select(R, 1, self.level_joints, out=workspace.R)
+        torch.index_select(J, 1, self.level_joints, out=workspace.J)
+        torch.index_select(workspace.J, 1, self.level_parent_positions, out=workspace.J_parent)
+        G_[:, :, :3, :3].copy_(workspace.R.transpose(0, 1))
+        G_[0, :, :3, 3].copy_(workspace.J[:, 0])
+        torch.sub(workspace.J[:, 1:].transpose(0, 1), workspace.J_parent.transpose(0, 1), out=G_[1:, :, :3, 3])
+        G[0].copy_(G_[0])
+        start = 1
+        for size in self.level_sizes[1:]:
+            parents = P[start - 1:start - 1 + size]
+            torch.index_select(G, 0, self.level_parent_positions[start - 1:start - 1 + size], out=parents)
+            torch.matmul(parents, G_[start:start + size], out=G[start:start + size])
+            start += size
+        G = torch.index_select(G, 0, self.level_inverse, out=workspace.G_global)
+
+        # The rest joints rotated by the global transforms are subtracted from their translation
+        A = workspace.A
+        A.copy_(G[:, :, :3, :])
+        J = J.transpose(0, 1)
+        for k in range(3):
+            A[:, :, :, 3].addcmul_(G[:, :, :3, k], J[:, :, None, k], value=-1)
+        return G.transpose(0, 1), A.transpose(0, 1)
+
+    def linear_blend_skinning(self, G, v_posed, vertex_ids=None):
+        '''
+            Poses the T-pose vertices with linear blend skinning
+        :param G: joint transforms relative to the rest pose - A batch size x 24 x 4 x 4 tensor
+        :param v_posed: batch size x 6890 x 3 vertices in T-pose
+        :param vertex_ids: optional subset of the vertices to evaluate
+        :return: batch size x 6890 x 3 posed vertices
+        '''
+        buffers = self.vertex_subset(vertex_ids)
+        batch_size, num_verts = v_posed.shape[:2]
+        if self.gradients == 'analytic':
+            return LinearBlendSkinning.apply(G, v_posed, buffers.weights)
+        if self.skinning == 'sparse':
+            # Blend only the top 3x4 part of the transforms of the joints influencing each vertex
+            G = G[:, :, :3, :].permute(1, 0, 2, 3).reshape(24, -1)
+            T = F.embedding_bag(buffers.skinning_joints, G, per_sample_weights=buffers.skinning_weights, mode='sum').view(num_verts, batch_size, 3, 4)
+            return transform_points(T, v_posed.transpose(0, 1)).transpose(0, 1)
+        # Only the top 3x4 part of the transforms is blended, the translation is added instead of
+        # multiplying homogeneous vertices
+        G = G[:, :, :3, :].permute(1, 0, 2, 3).reshape(24, -1)
+        if self.use_workspace and not (torch.is_grad_enabled() and (G.requires_grad or v_posed.requires_grad)):
+            T = self.workspace(batch_size, G.device, G.dtype).T
+            if num_verts not in T:
+                T[num_verts] = torch.empty(num_verts, batch_size * 12, dtype=G.dtype, device=G.device)
+            T = torch.matmul(buffers.weights, G, out=T[num_verts])
+        else:
+            T = torch.matmul(buffers.weights, G)
+        T = T.view(num_verts, batch_size, 3, 4)
+        return transform_points(T, v_posed.transpose(0, 1)).transpose(0, 1)
+
+    def evaluate(self, pose, betas, trans, outputs, vertex_ids=None):
+        '''
+            Evaluates only what the requested outputs depend on, the other
+            intermediates are not computed or are released before returning
+        :param pose: pose  parameters - A batch size x 72 tensor (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :param outputs: A sequence of STAROutput field names
+        :param vertex_ids: optional sequence of vertex indices to evaluate
+        :return: A STAROutput, the fields not requested are None
+        '''
+        if self.use_compile:
+            return compiled_evaluate()(self, pose, betas, trans, outputs, vertex_ids)
+        return self._evaluate(pose, betas, trans, outputs, vertex_ids)
+
+    def _evaluate(self, pose, betas, trans, outputs, vertex_ids=None):
+        for name in outputs:
+            if name not in STAROutput._fields:
+                raise RuntimeError('Invalid output %s' % (name))
+        batch_size = pose.shape[0]
+        want_v = 'v' in outputs
+        want_v_posed = want_v or 'v_posed' in outputs
+        want_J_transformed = want_v or 'J_transformed' in outputs
+
+        # The analytic blend shapes add both bases at once, v_shaped is only evaluated when requested
+        analytic_blend = self.gradients == 'analytic'
+
+        v, v_posed, v_shaped, J_transformed = None, None, None, None
+        if 'v_shaped' in outputs or (want_v_posed and not analytic_blend):
+            v_shaped, J = self.shape_blend_shapes(betas, vertex_ids)
+        else:
+            J = self.joints_rest(betas)
+
+        if want_v_posed:
+            pose_quat = quat_feat(pose.view(-1, 3)).view(batch_size, -1)
+            pose_feat = torch.cat((pose_quat[:, 4:], betas[:, 1:2]), 1)
+            if analytic_blend:
+                buffers = self.vertex_subset(vertex_ids)
+                sparse = self.pose_blend == 'sparse' and (pose_feat.is_cuda or pose_feat.dtype in [torch.float32, torch.float64])
+                v_posed = BlendShapes.apply(betas, pose_feat, buffers.v_template, self.shape_basis(vertex_ids).t(),
+                                            buffers.posedirs, self.posedirs_sparse(vertex_ids) if sparse else None)
+            else:
+                v_posed = v_shaped + self.pose_blend_shapes(pose_feat, vertex_ids)
+
+        # The scratch tensors can not hold the values autograd saves for the backward
+        workspace = None
+        if self.use_workspace and not (torch.is_grad_enabled() and any(x.requires_grad for x in [pose, betas, trans])):
+            workspace = self.workspace(batch_size, pose.device, pose.dtype)
+
+        if want_J_transformed:
+            R = rodrigues(pose.view(-1, 3)).view(batch_size, 24, 3, 3)
+            if workspace is not None:
+                G, A = self._transforms_workspace(R, J, workspace)
+            else:
+                G = self.global_rigid_transformation(R, J)
+            J_transformed = G[:, :, :3, 3] + trans[:, None, :]
+
+        if want_v:
+            if workspace is None:
+                # Transforms relative to the rest pose, the rest joints are subtracted from the translation
+                A = G - F.pad(torch.matmul(G[:, :, :3, :3], J[:, :, :, None]), (3, 0, 0, 1))
+            v = self.linear_blend_skinning(A, v_posed, vertex_ids)
+            if workspace is not None:
+                v = v.add_(trans[:, None, :])
+            else:
+                v = v + trans[:, None, :]
+
+        results = {'v': v, 'v_posed': v_posed, 'v_shaped': v_shaped, 'J': J, 'J_transformed': J_transformed}
+        return STAROutput(*[results[name] if name in outputs else None for name in STAROutput._fields])
+
+    def evaluate_chunked(self, pose, betas, trans, max_bytes=2 ** 30, outputs=('v', 'J_transformed'), out=None, vertex_ids=None):
+        '''
+            Evaluates a large number of parameters in chunks sized from a memory
+            budget and streams the results into numpy arrays
+        :param pose: pose  parameters - A number of samples x 72 array or tensor
+        :param betas: beta  parameters - A number of samples x number of betas array or tensor
+        :param trans: trans parameters - A number of samples x 3 array or tensor
+        :param max_bytes: memory budget of the intermediates of one chunk
+        :param outputs: A sequence of STAROutput field names
+        :param out: optional dictionary of preallocated arrays per output name, for
+                    example numpy memmaps, the missing ones are allocated
+        :param vertex_ids: optional sequence of vertex indices to evaluate
+        :return: A STAROutput of numpy arrays, the fields not requested are None
+        '''
+        for name in outputs:
+            if name not in STAROutput._fields:
+                raise RuntimeError('Invalid output %s' % (name))
+        num_samples = pose.shape[0]
+        num_verts = 6890 if vertex_ids is None else len(vertex_ids)
+        dtype = self.v_template.dtype
+        # numpy has no bfloat16, those results are stored as float32
+        np_dtype = torch.empty(0, dtype=torch.float32 if dtype == torch.bfloat16 else dtype).numpy().dtype
+
+        # Rough peak of the intermediates of one sample, dominated by the per vertex skinning transforms
+        if 'v' in outputs:
+            sample_size = 48 * num_verts
+        elif 'v_posed' in outputs or 'v_shaped' in outputs:
+            sample_size = 12 * num_verts
+        else:
+            sample_size = 24 * 32
+        chunk_size = max(1, int(max_bytes // (sample_size * torch.empty(0, dtype=dtype).element_size())))
+
+        shapes = {'v': (num_verts, 3), 'v_posed': (num_verts, 3), 'v_shaped': (num_verts, 3), 'J': (24, 3), 'J_transformed': (24, 3)}
+        out = dict(out) if out is not None else {}
+        for name in outputs:
+            if name not in out:
+                out[name] = np.empty((num_samples,) + shapes[name], dtype=np_dtype)
+
+        device = self.v_template.device
+        with torch.no_grad():
+            for start in range(0, num_samples, chunk_size):
+                end = min(start + chunk_size, num_samples)
+                chunk = [torch.as_tensor(x[start:end], dtype=dtype, device=device) for x in [pose, betas, trans]]
+                output = self.evaluate(chunk[0], chunk[1], chunk[2], outputs, vertex_ids)
+                for name in outputs:
+                    out[name][start:end] = getattr(output, name).to(torch.float32 if dtype == torch.bfloat16 else dtype).cpu().numpy()
+        return STAROutput(*[out[name] if name in outputs else None for name in STAROutput._fields])
+
+    def forward(self, pose, betas , trans, vertex_ids=None, outputs=None):
         '''
             STAR forward pass given pose, betas (shape) and trans
             return the model vertices and transformed joints
         :param pose: pose  parameters - A batch size x 72 tensor (3 numbers for each joint)
         :param beta: beta  parameters - A batch size x number of betas
         :param beta: trans parameters - A batch size x 3
+        :param vertex_ids: optional sequence of vertex indices, only these vertices are
+                           evaluated and returned (6890 below becomes the subset size)
+        :param outputs: optional sequence of STAROutput field names, when given a STAROutput
+                        holding only these outputs is returned instead of the vertices
         :return:
                  v         : batch size x 6890 x 3
                              The STAR model vertices
@@ -157,53 +727,130 @@ class STAR(nn.Module):
                                 Posed model joints.
                  v.f: A numpy array of the model face.
         '''
-        device = pose.device
-        batch_size = pose.shape[0]
-        v_template = self.v_template[None, :]
-        shapedirs  = self.shapedirs.view(-1, self.num_betas)[None, :].expand(batch_size, -1, -1)
-        beta = betas[:, :, None]
-        v_shaped = torch.matmul(shapedirs, beta).view(-1, 6890, 3) + v_template
-        J = torch.einsum('bik,ji->bjk', [v_shaped, self.J_regressor])
-
-        pose_quat = quat_feat(pose.view(-1, 3)).view(batch_size, -1)
-        pose_feat = torch.cat((pose_quat[:,4:],beta[:,1]),1)
+        if outputs is not None:
+            return self.evaluate(pose, betas, trans, outputs, vertex_ids)
+        output = self.evaluate(pose, betas, trans, ('v', 'v_posed', 'v_shaped', 'J_transformed'), vertex_ids)
+        v = output.v
+        v.f = self.f
+        v.v_posed = output.v_posed
+        v.v_shaped = output.v_shaped
+        v.J_transformed = output.J_transformed
+        return v
 
-        R = rodrigues(pose.view(-1, 3)).view(batch_size, 24, 3, 3)
-        R = R.view(batch_size, 24, 3, 3)
+    def joints(self, pose, betas, trans):
+        '''
+            STAR posed joints given pose, betas (shape) and trans, the pose blend
+            shapes and the skinning of the vertices are not evaluated
+        :param pose: pose  parameters - A batch size x 72 tensor (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :return: batch size x 24 x 3
+                 Posed model joints, the J_transformed of the forward pass.
+        '''
+        return self.evaluate(pose, betas, trans, ('J_transformed',)).J_transformed
 
-        posedirs = self.posedirs[None, :].expand(batch_size, -1, -1)
-        v_posed = v_shaped + torch.matmul(posedirs, pose_feat[:, :, None]).view(-1, 6890, 3)
-        
-        J_ = J.clone()
-        J_[:, 1:, :] = J[:, 1:, :] - J[:, self.parent, :]
-        G_ = torch.cat([R, J_[:, :, :, None]], dim=-1)
-        pad_row = torch.FloatTensor([0, 0, 0, 1]).to(device).view(1, 1, 1, 4).expand(batch_size, 24, -1, -1)
-        G_ = torch.cat([G_, pad_row], dim=2)
-        G = [G_[:, 0].clone()]
-        for i in range(1, 24):
-            G.append(torch.matmul(G[self.parent[i - 1]], G_[:, i, :, :]))
-        G = torch.stack(G, dim=1)
-
-        rest = torch.cat([J, torch.zeros(batch_size, 24, 1).to(device)], dim=2).view(batch_size, 24, 4, 1)
-        zeros = torch.zeros(batch_size, 24, 4, 3).to(device)
-        rest = torch.cat([zeros, rest], dim=-1)
-        rest = torch.matmul(G, rest)
-        G = G - rest
-        T = torch.matmul(self.weights, G.permute(1, 0, 2, 3).contiguous().view(24, -1)).view(6890, batch_size, 4,4).transpose(0, 1)
-        rest_shape_h = torch.cat([v_posed, torch.ones_like(v_posed)[:, :, [0]]], dim=-1)
-        v = torch.matmul(T, rest_shape_h[:, :, :, None])[:, :, :3, 0]
-        v = v + trans[:,None,:]
+    def rest_pose(self, betas, trans, vertex_ids=None):
+        '''
+            STAR vertices in the rest pose given betas (shape) and trans, this matches
+            the forward pass with a zero pose without evaluating the rotations, the
+            kinematic chain or the skinning
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :param vertex_ids: optional sequence of vertex indices to evaluate
+        :return:
+                 v         : batch size x 6890 x 3
+                             The STAR model vertices in the rest pose
+                 v.v_posed : batch size x 6890 x 3
+                             STAR vertices in T-pose after adding the shape
+                             blend shapes and pose blend shapes
+                 v.v_shaped: batch size x 6890 x 3
+                             STAR vertices in T-pose after adding the shape
+                             blend shapes
+                 v.J_transformed:batch size x 24 x 3
+                                Rest pose model joints.
+                 v.f: A numpy array of the model face.
+        '''
+        v_shaped, J = self.shape_blend_shapes(betas, vertex_ids)
+        # With a zero pose only the shape feature of the pose corrective blend shapes is active
+        posedirs = self.vertex_subset(vertex_ids).posedirs
+        v_posed = v_shaped + (betas[:, 1:2] * posedirs[None, :, -1]).view(betas.shape[0], -1, 3)
+        v = v_posed + trans[:, None, :]
         v.f = self.f
         v.v_posed = v_posed
         v.v_shaped = v_shaped
+        v.J_transformed = J + trans[:, None, :]
+        return v
+
 
-        root_transform = with_zeros(torch.cat((R[:,0],J[:,0][:,:,None]),2))
-        results =  [root_transform]
-        for i in range(0, self.parent.shape[0]):
-            transform_i = with_zeros(torch.cat((R[:, i + 1], J[:, i + 1][:,:,None] - J[:, self.parent[i]][:,:,None]), 2))
-            curr_res = torch.matmul(results[self.parent[i]],transform_i)
-            results.append(curr_res)
-        results = torch.stack(results, dim=1)
-        posed_joints = results[:, :, :3, 3]
-        v.J_transformed = posed_joints + trans[:,None,:]
+class STARMulti(nn.Module):
+    def __init__(self, genders=('male', 'female', 'neutral'), num_betas=10, device='cpu', dtype=None):
+        '''
+            STAR models of several genders evaluated together, each sample of a
+            batch selects its model with a gender index
+        :param genders: A sequence of model genders
+        :param num_betas: number of shape parameters
+        :param device: device of the model buffers
+        :param dtype: data type of the model buffers, defaults to cfg.data_type
+        '''
+        super(STARMulti, self).__init__()
+        models = [STAR(gender, num_betas=num_betas, device=device, dtype=dtype) for gender in genders]
+        for model in models[1:]:
+            if not torch.equal(model.parent, models[0].parent):
+                raise RuntimeError('The models do not share the same kinematic tree')
+        self.genders = list(genders)
+        self.num_betas = num_betas
+        self.f = models[0].f
+        self.register_buffer('faces', models[0].faces.clone())
+        self.models = nn.ModuleList(models)
+
+    def gender_index(self, gender, device):
+        if torch.is_tensor(gender):
+            gender = gender.to(device=device, dtype=torch.long)
+            return gender.reshape(1) if gender.dim() == 0 else gender
+        if isinstance(gender, (str, int)):
+            gender = [gender]
+        for g in gender:
+            if isinstance(g, str) and g not in self.genders:
+                raise RuntimeError('Invalid Gender %s' % (g))
+        return torch.tensor([self.genders.index(g) if isinstance(g, str) else g for g in gender], dtype=torch.long, device=device)
+
+    def forward(self, pose, betas, trans, gender):
+        '''
+            STAR forward pass of a batch mixing the model genders
+        :param pose: pose  parameters - A batch size x 72 tensor (3 numbers for each joint)
+        :param betas: beta  parameters - A batch size x number of betas
+        :param trans: trans parameters - A batch size x 3
+        :param gender: A batch size tensor of indices in genders, or a sequence of gender
+                       names or indices
+        :return: the vertices and their attributes, as returned by STAR.forward
+        '''
+        batch_size = pose.shape[0]
+        gender = self.gender_index(gender, pose.device)
+        if gender.shape == (1,) and batch_size > 1:
+            gender = gender.expand(batch_size)
+        if gender.dim() != 1 or gender.shape[0] != batch_size:
+            raise RuntimeError('Invalid Gender, expected one gender per sample of the batch of %d' % (batch_size))
+        if batch_size > 0 and (int(gender.min()) < 0 or int(gender.max()) >= len(self.genders)):
+            raise RuntimeError('Invalid Gender index, expected indices between 0 and %d' % (len(self.genders) - 1))
+
+        # The batch is grouped by gender once, the samples of a gender are evaluated together
+        # with the buffers of its model and the results are put back in the batch order
+        order = torch.argsort(gender, stable=True)
+        counts = torch.bincount(gender, minlength=len(self.genders)).tolist()
+        names = ('v', 'v_posed', 'v_shaped', 'J_transformed')
+        results = []
+        for model, ids in zip(self.models, torch.split(order, counts)):
+            if len(ids) == batch_size:
+                results.append(model.evaluate(pose, betas, trans, names))
+            elif len(ids) > 0:
+                results.append(model.evaluate(pose[ids], betas[ids], trans[ids], names))
+        if len(results) == 1:
+            v, v_posed, v_shaped, J_transformed = [getattr(results[0], name) for name in names]
+        else:
+            inverse = torch.argsort(order)
+            v, v_posed, v_shaped, J_transformed = [torch.cat([getattr(result, name) for result in results])[inverse] for name in names]
+        v.f = self.f
+        v.v_posed = v_posed
+        v.v_shaped = v_shaped
+        v.J_transformed = J_transformed
         return v
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import asyncio
+import json
+import numpy as np
+import torch
+from .pytorch.star import STAR , STAROutput
+
+class STARServer(object):
+    '''
+        Evaluates STAR for concurrent asyncio requests, the requests arriving within max_wait
+        seconds of each other are evaluated together in a single batch of at most max_batch.
+    '''
+    def __init__(self, model=None, max_batch=64, max_wait=0.002, outputs=('v', 'J_transformed'), **model_kwargs):
+        '''
+        :param model: a STAR model, constructed from model_kwargs when None
+        :param max_batch: maximum number of requests evaluated together
+        :param max_wait: maximum time in seconds a request waits for the batch to fill
+        :param outputs: the STAROutput field names returned for each request
+        '''
+        for name in outputs:
+            if name not in STAROutput._fields:
+                raise RuntimeError('Invalid output %s, expected one of %s' % (name, ', '.join(STAROutput._fields)))
+        if max_batch < 1:
+            raise RuntimeError('max_batch should be positive')
+        self.model = model if model is not None else STAR(**model_kwargs)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.outputs = tuple(outputs)
+        self.queue = None
+        self.worker = None
+        # The requests being evaluated
+        self.batch = []
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        '''
+            Stops the worker, the requests it has not answered yet fail and the
+            new requests are rejected until the server is started again
+        '''
+        if self.worker is not None:
+            worker, self.worker = self.worker, None
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+            requests = self.batch
+            self.batch = []
+            while not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+            for request in requests:
+                if not request[3].done():
+                    request[3].set_exception(RuntimeError('The server stopped before evaluating the request'))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def infer(self, pose, betas, trans):
+        '''
+            Evaluates a single body.
+        :param pose: 72 pose parameters
+        :param betas: num_betas shape parameters
+        :param trans: 3 translation parameters
+        :return: A dict of numpy arrays keyed on the output names
+        '''
+        if self.worker is None:
+            raise RuntimeError('The server is not started')
+        # A malformed request is rejected here, before it can fail the batch it would join
+        parameters = []
+        for name, value, size in [('pose', pose, 72), ('betas', betas, self.model.num_betas), ('trans', trans, 3)]:
+            try:
+                value = np.asarray(value, dtype=np.float64).reshape(-1)
+            except (TypeError, ValueError):
+                raise RuntimeError('Invalid %s, expected %d numbers' % (name, size))
+            if value.shape[0] != size:
+                raise RuntimeError('Invalid %s, expected %d numbers and got %d' % (name, size, value.shape[0]))
+            parameters.append(value)
+        pose, betas, trans = parameters
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((pose, betas, trans, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # The batch is visible to stop from its first request on
+            self.batch = requests = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(requests) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch = requests = [request for request in requests if not request[3].done()]
+            if not requests:
+                continue
+            try:
+                # The model runs in a thread so that requests keep being queued meanwhile
+                results = await loop.run_in_executor(None, self._evaluate, requests)
+            except Exception as error:
+                self.batch = []
+                for request in requests:
+                    if not request[3].done():
+                        request[3].set_exception(error)
+                continue
+            self.batch = []
+            for request, result in zip(requests, results):
+                if not request[3].done():
+                    request[3].set_result(result)
+
+    def _evaluate(self, requests):
+        dtype, device = self.model.v_template.dtype, self.model.v_template.device
+        pose, betas, trans = [torch.as_tensor(np.stack([request[i] for request in requests]), dtype=dtype, device=device)
+                              for i in range(3)]
+        with torch.no_grad():
+            output = self.model.evaluate(pose, betas, trans, self.outputs)
+        output = {name: getattr(output, name).cpu().numpy() for name in self.outputs}
+        return [{name: output[name][i] for name in self.outputs} for i in range(len(requests))]
+
+async def serve(host='127.0.0.1', port=8765, server=None, **server_kwargs):
+    '''
+        Serves STAR over TCP, each request is a line holding a json object with the
+        pose, betas and trans lists and is answered with a json line of the outputs.
+    :param server: a STARServer, constructed from server_kwargs when None
+    '''
+    server = server if server is not None else STARServer(**server_kwargs)
+    await server.start()
+
+    async def answer(line):
+        try:
+            request = json.loads(line)
+            result = await server.infer(request['pose'], request['betas'], request['trans'])
+            return {name: value.tolist() for name, value in result.items()}
+        except Exception as error:
+            return {'error': str(error)}
+
+    async def handle(reader, writer):
+        answers = asyncio.Queue()
+
+        async def write_answers():
+            # Answers are written in the order of the requests
+            while True:
+                answer_task = await answers.get()
+                if answer_task is None:
+                    break
+                writer.write((json.dumps(await answer_task) + '\n').encode())
+                await writer.drain()
+
+        writing = asyncio.ensure_future(write_answers())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                answers.put_nowait(asyncio.ensure_future(answer(line)))
+            answers.put_nowait(None)
+            await writing
+        finally:
+            writing.cancel()
+            writer.close()
+
+    tcp_server = await asyncio.start_server(handle, host, port)
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        await server.stop()
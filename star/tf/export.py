@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import tensorflow as tf
+from .star import STAR
+
+def export_saved_model(gender, path=None, num_betas=10, dtype=None, jit_compile=False):
+    '''
+        Exports the TensorFlow STAR to a SavedModel with a dynamic batch dimension and the signatures
+            vertices      : pose, betas, trans -> v (batch size x 6890 x 3), J_transformed (batch size x 24 x 3)
+            joints        : pose, betas, trans -> J_transformed
+            shape         : betas -> v_shaped (batch size x 6890 x 3), J (batch size x 24 x 3)
+        where vertices is also the serving_default signature
+    :param gender: male, female or neutral
+    :param path: output directory, defaults to star_<gender>
+    :param num_betas: number of shape parameters
+    :param dtype: data type of the model and of the signature inputs, defaults to cfg.data_type
+    :param jit_compile: exports the XLA compiled skinning
+    :return: path of the written SavedModel
+    '''
+    if path is None:
+        path = 'star_%s' % (gender)
+    model = STAR(gender=gender, num_betas=num_betas, jit_compile=jit_compile, dtype=dtype)
+    pose_spec  = tf.TensorSpec([None, 72], model.dtype, name='pose')
+    betas_spec = tf.TensorSpec([None, num_betas], model.dtype, name='betas')
+    trans_spec = tf.TensorSpec([None, 3], model.dtype, name='trans')
+
+    @tf.function(input_signature=[pose_spec, betas_spec, trans_spec])
+    def vertices(pose, betas, trans):
+        v, J_transformed = model.forward(pose, betas, trans)
+        return {'v': v, 'J_transformed': J_transformed}
+
+    @tf.function(input_signature=[pose_spec, betas_spec, trans_spec])
+    def joints(pose, betas, trans):
+        return {'J_transformed': model.joints(pose, betas, trans)}
+
+    @tf.function(input_signature=[betas_spec])
+    def shape(betas):
+        v_shaped, J = model.shape(betas)
+        return {'v_shaped': v_shaped, 'J': J}
+
+    signatures = {'serving_default': vertices, 'vertices': vertices, 'joints': joints, 'shape': shape}
+    tf.saved_model.save(model, path, signatures=signatures)
+    return path
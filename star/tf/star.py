@@ -23,13 +23,18 @@
 import tensorflow as tf
 import numpy as np
 from ..config import cfg 
+from ..assets import load_model, kinematic_levels, check_precision
 import os 
 
 @tf.function
 def quaternions_all(p):
+    dtype = p.dtype
+    if dtype == tf.float16:
+        # The clipping epsilon and the trigonometry need single precision
+        p = tf.cast(p, tf.float32)
     batch_size = tf.shape(p)[0]
     num_joints = tf.shape(p)[1]
-    angle = tf.reshape(tf.sqrt(tf.clip_by_value(tf.reduce_sum(tf.square(p), 2), tf.constant(1e-16, dtype=tf.float32),tf.constant(1e16, dtype=tf.float32)), name='angles'), [batch_size,num_joints,1])
+    angle = tf.reshape(tf.sqrt(tf.clip_by_value(tf.reduce_sum(tf.square(p), 2), tf.constant(1e-16, dtype=p.dtype),tf.constant(1e16, dtype=p.dtype)), name='angles'), [batch_size,num_joints,1])
     norm_p = p / angle
     norm_p = tf.transpose(norm_p, [2, 0, 1])
     ####################################################################################################################
@@ -46,71 +51,89 @@ def quaternions_all(p):
     qw = cose_angle
     norm_quat = tf.reshape(tf.stack([qx-0, qy-0, qz-0, qw-1], axis=2),[batch_size,-1])
     ####################################################################################################################
-    return norm_quat
+    return tf.cast(norm_quat, dtype)
 
 @tf.function
-def global_rigid_transformation(rot_mat, J):
+def global_rigid_transformation(rot_mat, J, kinematic_tree):
     '''
     TensorFlow implementation of the global rigid transformation.
     :param rot_mat: batch_size x num_joints x 3 x 3 tensor of the rotation matrices.
     :param J      : batch_size x num_joints x 3 tensor of 3D joints positions
-    :param kintree_table: a 2D array encoding the body kinemenatic tree.
-           First row is the index of the parent node, second row is the index of a child node.
+    :param kinematic_tree: a tuple (parent, level_joints, level_parents, level_sizes) of tuples of ints,
+           the parent of every non root joint and the joints grouped by depth as given by kinematic_levels.
     :return: result: batch_size x num_joints x 4 x 4 x tensors
     '''
-    batch_size = rot_mat.shape[0]
-    num_joints =24
-    kintree_table = cfg.kintree_table
-    parent_nodes = kintree_table[0,1:]
-    Js = tf.cast(J, tf.float32) - tf.concat([tf.zeros([batch_size, 1, 3], dtype=tf.float32), tf.gather(J, parent_nodes, axis=1)], axis=1)
+    parent, level_joints, level_parents, level_sizes = kinematic_tree
+    batch_size = tf.shape(rot_mat)[0]
+    dtype = J.dtype
+    num_joints = len(level_joints)
+    Js = J - tf.concat([tf.zeros([batch_size, 1, 3], dtype=dtype), tf.gather(J, list(parent), axis=1)], axis=1)
     Js = tf.expand_dims(Js, axis=-1)
-    T = tf.concat([tf.cast(rot_mat,tf.float32), Js],axis=-1)
-    T = tf.concat([T, tf.tile(tf.constant([[[[0.0, 0.0, 0.0, 1.0]]]], dtype=tf.float32), [batch_size, num_joints, 1, 1])], axis=2)
-    T = tf.unstack(T, axis=1)
-    results = {i: None for i in range(0, J.shape[1])}
-    results[0] = T[0]
-
-    for i in range(1, J.shape[1]):
-        results[i] = tf.einsum('ijk,ikl->ijl', results[kintree_table[0,i]], T[i])
-    results_global = tf.stack([results[i] for i in range(0, J.shape[1])], axis=1)
-
-    Jt = tf.einsum('ijkl,ijl->ijk', results_global, tf.concat([J, tf.zeros([batch_size, num_joints, 1], dtype=tf.float32)], axis=-1))
-    results = results_global - tf.concat([tf.zeros([batch_size, num_joints, 4, 3], dtype=tf.float32), tf.expand_dims(Jt, axis=-1)], axis=-1)
+    T = tf.concat([tf.cast(rot_mat,dtype), Js],axis=-1)
+    T = tf.concat([T, tf.tile(tf.constant([[[[0.0, 0.0, 0.0, 1.0]]]], dtype=dtype), [batch_size, num_joints, 1, 1])], axis=2)
+
+    # Every depth level of the tree is composed with its parents in a single batched matmul
+    T = tf.split(tf.gather(T, list(level_joints), axis=1), list(level_sizes), axis=1)
+    results = [T[0]]
+    start = 0
+    for d in range(1, len(level_sizes)):
+        parents = list(level_parents[start:start + level_sizes[d]])
+        start += level_sizes[d]
+        G = results[-1]
+        # The gather is skipped when the parents are the previous level in order, or its single joint
+        if parents != list(range(level_sizes[d - 1])) and level_sizes[d - 1] > 1:
+            G = tf.gather(G, parents, axis=1)
+        results.append(tf.matmul(G, T[d]))
+    results_global = tf.gather(tf.concat(results, axis=1), np.argsort(level_joints).tolist(), axis=1)
+
+    Jt = tf.einsum('ijkl,ijl->ijk', results_global, tf.concat([J, tf.zeros([batch_size, num_joints, 1], dtype=dtype)], axis=-1))
+    results = results_global - tf.concat([tf.zeros([batch_size, num_joints, 4, 3], dtype=dtype), tf.expand_dims(Jt, axis=-1)], axis=-1)
     return results, results_global
 
 
 
     
 @tf.function
-def verts_core(pose, v, J, weights, kintree_table):
+def verts_core(pose, v, J, weights, kinematic_tree, fused=False):
     '''
     Core linear blend skinning function.
     :param pose: num_batches x num_joints x 3 rotation vectors.
     :param v: batch_size x num_vertices x 3 shaped verticies.
     :param J: batch_size x num_joints x 3 joint location.
     :param weights: num_vertices x num_joints.
-    :param kintree_table: Kinematic tree 2 x num_joints.
+    :param kinematic_tree: Kinematic tree, as passed to global_rigid_transformation.
     :param want_Jtr: Transformed joints location.
+    :param fused: blends and applies only the 3x4 part of the joint transforms
     :return: batch_size x num_vertices x 3 transformed vertices
     '''
     batch_size = tf.shape(pose)[0]
     rot_mat = tf_rodrigues(pose)
-    A , A_global = global_rigid_transformation(rot_mat, J)
+    A , A_global = global_rigid_transformation(rot_mat, J, kinematic_tree)
+    Jtr = A_global[:,:,:3,3]
+
+    if fused:
+        # batch_size x num_vertices x 3 x 4, the homogeneous row is never blended
+        A_weighted = tf.reshape(tf.einsum('vj,bjk->bvk', weights, tf.reshape(A[:,:,:3,:], [batch_size, 24, 12])), [batch_size, -1, 3, 4])
+        v = A_weighted[:,:,:,3] + A_weighted[:,:,:,0]*v[:,:,0:1] + A_weighted[:,:,:,1]*v[:,:,1:2] + A_weighted[:,:,:,2]*v[:,:,2:3]
+        return v, Jtr
 
 
     A_weighted = tf.einsum('ijkl,mj->imkl', A, weights)
 
-    rest_shape_h = tf.concat([v, tf.ones([batch_size, 6890, 1], dtype=tf.float32)], axis=-1)
+    rest_shape_h = tf.concat([v, tf.ones([batch_size, 6890, 1], dtype=v.dtype)], axis=-1)
     v = A_weighted[:,:,:,0]* tf.expand_dims(rest_shape_h[:,:,0],axis=-1) + A_weighted[:,:,:,1]*tf.expand_dims(rest_shape_h[:,:,1],axis=-1) \
         + A_weighted[:,:,:,2]*tf.expand_dims(rest_shape_h[:,:,2],axis=-1) + A_weighted[:,:,:,3]*tf.expand_dims(rest_shape_h[:,:,3],axis=-1)
 
     v = tf.slice(v, [0, 0, 0], [-1, -1, 3])
-    Jtr = A_global[:,:,:3,3]
 
    
 
     return v, Jtr
 
+# The chain and the skinning compiled with XLA. The blend shapes stay out of it, for a batch of one
+# XLA turns their matmul into a loop fusion that evaluates the pose features again for every vertex
+verts_core_xla = tf.function(verts_core.python_function, jit_compile=True)
+
 
 @tf.function 
 def tf_rodrigues(p):
@@ -120,10 +143,14 @@ def tf_rodrigues(p):
     :param p:
     :return:
     '''
+    dtype = p.dtype
+    if dtype == tf.float16:
+        # The clipping epsilon and the trigonometry need single precision
+        p = tf.cast(p, tf.float32)
     batch_size = tf.shape(p)[0]
     num_joints = tf.shape(p)[1]
 
-    angles = tf.reshape(tf.sqrt(tf.clip_by_value(tf.reduce_sum(tf.square(p), 2), tf.constant(1e-16,dtype=tf.float32), tf.constant(1e16,dtype=tf.float32)), name='angles'),[batch_size, num_joints, 1])
+    angles = tf.reshape(tf.sqrt(tf.clip_by_value(tf.reduce_sum(tf.square(p), 2), tf.constant(1e-16,dtype=p.dtype), tf.constant(1e16,dtype=p.dtype)), name='angles'),[batch_size, num_joints, 1])
     norm_p = p / angles
 
     ppt = tf.einsum('ijkl,ijlm->ijkm', tf.expand_dims(norm_p, axis=-1), tf.expand_dims(norm_p, axis=2))
@@ -131,15 +158,15 @@ def tf_rodrigues(p):
     rx = tf.reshape(rx, [batch_size, num_joints, 1, 1])
     ry = tf.reshape(ry, [batch_size, num_joints, 1, 1])
     rz = tf.reshape(rz, [batch_size, num_joints, 1, 1])
-    zrs = tf.zeros([batch_size, num_joints, 1, 1],dtype=tf.float32)
+    zrs = tf.zeros([batch_size, num_joints, 1, 1],dtype=p.dtype)
 
     skewmat = tf.reshape(tf.concat([zrs, -rz, ry, rz, zrs, -rx, -ry, rx, zrs], axis=-1), [batch_size, num_joints, 3, 3])
     cos_angles = tf.tile(tf.expand_dims(tf.cos(angles),axis=-1),[1,1,3,3])
     sin_angles = tf.tile(tf.expand_dims(tf.sin(angles),axis=-1),[1,1,3,3])
 
-    R = tf.multiply(cos_angles, tf.tile(tf.expand_dims(tf.expand_dims(tf.eye(3,3,dtype=tf.float32), axis=0), axis=0),[batch_size, num_joints, 1, 1]))\
+    R = tf.multiply(cos_angles, tf.tile(tf.expand_dims(tf.expand_dims(tf.eye(3,3,dtype=p.dtype), axis=0), axis=0),[batch_size, num_joints, 1, 1]))\
         + tf.multiply((1-cos_angles),ppt) + tf.multiply(sin_angles,skewmat)
-    return R
+    return tf.cast(R, dtype)
 
 @tf.function 
 def lrotmin(p):
@@ -152,12 +179,18 @@ def lrotmin(p):
     batch_size = tf.shape(p)[0]
     num_joints = tf.shape(p)[1]
     p = tf.slice(p, [0, 1, 0], [-1, -1, -1])
-    I = tf.tile(tf.expand_dims(tf.expand_dims(tf.eye(3, 3, dtype=tf.float32), axis=0), axis=0), [batch_size, num_joints-1, 1, 1])
+    I = tf.tile(tf.expand_dims(tf.expand_dims(tf.eye(3, 3, dtype=p.dtype), axis=0), axis=0), [batch_size, num_joints-1, 1, 1])
     rotmat = tf.reshape(tf_rodrigues(p) - I, [batch_size, -1])
     return rotmat
 
-class STAR(object):
-    def __init__(self,gender='female',num_betas=10):
+class STAR(tf.Module):
+    def __init__(self,gender='female',num_betas=10,jit_compile=False,dtype=None):
+        '''
+        :param jit_compile: compiles the kinematic chain and the fused 3x4 skinning with XLA,
+                            XLA compiles once per batch size
+        :param dtype: data type of the model and of its inputs, float16, float32 or float64,
+                      defaults to cfg.data_type
+        '''
 
         if gender.lower() not in ['male','female','neutral']:
             raise RuntimeError('Invalid model gender')
@@ -171,40 +204,100 @@ class STAR(object):
 
         if not os.path.exists(path_model):
             raise RuntimeError('Path does not exist %s' % (path_model))
-        import numpy as np
+        super(STAR, self).__init__(name='star_%s' % (gender.lower()))
 
-        self.smpl_model = np.load(path_model,allow_pickle=True)
-        cfg.kintree_table = self.smpl_model['kintree_table'].astype(np.int32)
+        self.smpl_model = load_model(path_model)
 
         self.num_betas = num_betas
-
-    @tf.function
-    def __call__(self,pose,betas,trans):
-        batch_size = pose.shape[0]
-        if cfg.data_type == 'float32':
-            dtype = tf.float32
-        elif cfg.data_type == 'float64':
-            dtype = tf.float64 
-        elif cfg.data_type == 'float16':
-            dtype = tf.float16 
-
-        self.J_regressor    = tf.constant(self.smpl_model['J_regressor'],dtype=dtype)
-        self.posedirs       = tf.constant(self.smpl_model['posedirs'],dtype=dtype)
-        self.shapedirs      = tf.constant(self.smpl_model['shapedirs'][:,:,:self.num_betas],dtype=dtype)
-        self.weights        = tf.constant(self.smpl_model['weights'],dtype=dtype)
+        dtype = tf.as_dtype(cfg.data_type if dtype is None else dtype)
+        if dtype not in [tf.float16, tf.float32, tf.float64]:
+            raise RuntimeError('Invalid data type %s' % (dtype.name))
+        check_precision(path_model, self.smpl_model, dtype.name)
+        self.dtype = dtype
+
+        # The model tensors are created once, read by the traced graph and saved with the module
+        self.J_regressor    = tf.Variable(self.smpl_model['J_regressor'],dtype=dtype,trainable=False,name='J_regressor')
+        self.posedirs       = tf.Variable(self.smpl_model['posedirs'],dtype=dtype,trainable=False,name='posedirs')
+        self.shapedirs      = tf.Variable(self.smpl_model['shapedirs'][:,:,:self.num_betas],dtype=dtype,trainable=False,name='shapedirs')
+        self.weights        = tf.Variable(self.smpl_model['weights'],dtype=dtype,trainable=False,name='weights')
+        self.v_template     = tf.Variable(self.smpl_model['v_template'],dtype=dtype,trainable=False,name='v_template')
+        # The joints regressed from the template and the shape blend shapes, for the joints only outputs
+        if 'J_template' in self.smpl_model:
+            J_template, J_shapedirs = self.smpl_model['J_template'], self.smpl_model['J_shapedirs']
+        else:
+            J_template  = self.smpl_model['J_regressor'].dot(self.smpl_model['v_template'])
+            J_shapedirs = np.einsum('ji,ikl->jkl', self.smpl_model['J_regressor'], self.smpl_model['shapedirs'][:,:,:self.num_betas])
+        self.J_template     = tf.Variable(J_template,dtype=dtype,trainable=False,name='J_template')
+        self.J_shapedirs    = tf.Variable(J_shapedirs[:,:,:self.num_betas],dtype=dtype,trainable=False,name='J_shapedirs')
         self.kintree_table  = self.smpl_model['kintree_table'].astype(np.int32)
+        # The kinematic tree of this model, as python ints so that the traced graph unrolls it
+        if 'parent' in self.smpl_model:
+            parent = self.smpl_model['parent'].tolist()
+        else:
+            id_to_col = {self.kintree_table[1, i]: i for i in range(self.kintree_table.shape[1])}
+            parent = [id_to_col[self.kintree_table[0, i]] for i in range(1, self.kintree_table.shape[1])]
+        if 'level_joints' in self.smpl_model:
+            levels = [self.smpl_model[name].tolist() for name in ['level_joints', 'level_parents', 'level_sizes']]
+        else:
+            levels = kinematic_levels(parent)
+        self.kinematic_tree = tuple(tuple(int(i) for i in x) for x in [parent] + list(levels))
         self.f = self.smpl_model['f']
-        tf_v_template = tf.constant(np.tile(self.smpl_model['v_template'],[batch_size,1,1]),dtype=dtype)
-        v_shaped = tf.add( tf.einsum('ijk,lk->lij', self.shapedirs, betas), tf_v_template)
+
+        # The batch dimension is dynamic so that a single trace serves every batch size
+        self.jit_compile = jit_compile
+        pose_spec  = tf.TensorSpec([None, 72], dtype, name='pose')
+        betas_spec = tf.TensorSpec([None, num_betas], dtype, name='betas')
+        trans_spec = tf.TensorSpec([None, 3], dtype, name='trans')
+        self.forward = tf.function(self.forward, input_signature=[pose_spec, betas_spec, trans_spec])
+        self.joints  = tf.function(self.joints, input_signature=[pose_spec, betas_spec, trans_spec])
+        self.shape   = tf.function(self.shape, input_signature=[betas_spec])
+
+    def forward(self,pose,betas,trans):
+        '''
+            STAR forward pass
+        :return: batch size x 6890 x 3 vertices and batch size x 24 x 3 posed joints
+        '''
+        v_shaped = self.shape_blend_shapes(betas)
 
         pose_feat = tf.concat([quaternions_all(tf.reshape(pose,(-1,24,3)))[:,4:],tf.expand_dims(betas[:,1],axis=1)],axis=1)
-        poseblendshapes = tf.einsum('ijk,lk->lij',self.posedirs,pose_feat)
+        poseblendshapes = tf.reshape(tf.matmul(pose_feat, tf.reshape(self.posedirs, [-1, 93]), transpose_b=True), [-1, 6890, 3])
         v_posed = v_shaped +  poseblendshapes
         tf_J = tf.einsum('ij,ajk->aik', self.J_regressor, v_shaped)
-        result, Jtr = verts_core(tf.reshape(pose,(-1,24,3)), v_posed, tf_J, self.weights, self.kintree_table)
-        result = tf.add(result, tf.tile(tf.expand_dims(trans, axis=1), [1, 6890, 1]))
-        result.Jtr = tf.add(Jtr, tf.tile(tf.expand_dims(trans, axis=1), [1, 24, 1]))
+        core = verts_core_xla if self.jit_compile else verts_core
+        result, Jtr = core(tf.reshape(pose,(-1,24,3)), v_posed, tf_J, self.weights, self.kinematic_tree, fused=self.jit_compile)
+        result = tf.add(result, tf.expand_dims(trans, axis=1))
+        Jtr = tf.add(Jtr, tf.expand_dims(trans, axis=1))
+        return result, Jtr
+
+    def shape_blend_shapes(self,betas):
+        '''
+        :param betas: batch size x num_betas shape parameters
+        :return: batch size x 6890 x 3 shaped vertices
+        '''
+        # The blend shapes are single matmuls with the flattened bases
+        return tf.add( tf.reshape(tf.matmul(betas, tf.reshape(self.shapedirs, [-1, self.num_betas]), transpose_b=True), [-1, 6890, 3]), self.v_template[None])
+
+    def joints(self,pose,betas,trans):
+        '''
+            The posed joints without skinning the vertices
+        :return: batch size x 24 x 3 posed joints
+        '''
+        J = tf.add( tf.reshape(tf.matmul(betas, tf.reshape(self.J_shapedirs, [-1, self.num_betas]), transpose_b=True), [-1, 24, 3]), self.J_template[None])
+        _ , A_global = global_rigid_transformation(tf_rodrigues(tf.reshape(pose,(-1,24,3))), J, self.kinematic_tree)
+        return tf.add(A_global[:,:,:3,3], tf.expand_dims(trans, axis=1))
+
+    def shape(self,betas):
+        '''
+            The unposed body of the shape parameters
+        :return: batch size x 6890 x 3 shaped vertices and batch size x 24 x 3 rest joints
+        '''
+        v_shaped = self.shape_blend_shapes(betas)
+        return v_shaped, tf.einsum('ij,ajk->aik', self.J_regressor, v_shaped)
+
+    def __call__(self,pose,betas,trans):
+        result, Jtr = self.forward(pose,betas,trans)
+        result.Jtr = Jtr
         result.pose =  pose
         result.trans = trans
         result.betas = betas
-        return result
\ No newline at end of file
+        return result
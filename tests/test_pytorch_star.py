@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG),
+# acting on behalf of its Max Planck Institute for Intelligent Systems and the
+# Max Planck Institute for Biological Cybernetics. All rights reserved.
+#
+# Max-Planck-Gesellschaft zur Förderung der Wissenschaften e.V. (MPG) is holder of all proprietary rights
+# on this computer program. You can only use this computer program if you have closed a license agreement
+# with MPG or you get the right to use the computer program from someone who is authorized to grant you that right.
+# Any use of the computer program without a valid license is prohibited and liable to prosecution.
+# Contact: ps-license@tuebingen.mpg.de
+#
+#
+# If you use this code in a research publication please consider citing the following:
+#
+# STAR: Sparse Trained  Articulated Human Body Regressor <https://arxiv.org/pdf/2008.08535.pdf>
+#
+#
+# Code Developed by:
+# Ahmed A. A. Osman
+
+import copy
+import unittest
+import torch
+from star.config import cfg
+from star.assets import load_model
+
+def model_available(gender):
+    try:
+        load_model(getattr(cfg, 'path_%s_star' % (gender)))
+    except Exception:
+        return False
+    return True
+
+GENDERS = [gender for gender in ['female', 'male', 'neutral'] if model_available(gender)]
+
+
+@unittest.skipUnless(GENDERS, 'The STAR models are not available')
+class TestPoseBlend(unittest.TestCase):
+    def setUp(self):
+        generator = torch.Generator().manual_seed(0)
+        self.pose = torch.randn(8, 72, generator=generator)
+        self.betas = 2 * torch.randn(8, 10, generator=generator)
+        self.trans = 2 * torch.randn(8, 3, generator=generator)
+
+    def test_sparse_matches_dense(self):
+        from star.pytorch.star import STAR
+        for gender in GENDERS:
+            reference = STAR(gender=gender, num_betas=10, pose_blend='dense')
+            star = STAR(gender=gender, num_betas=10, pose_blend='sparse')
+            d_ref = reference(self.pose, self.betas, self.trans)
+            d = star(self.pose, self.betas, self.trans)
+            torch.testing.assert_close(d.v_posed, d_ref.v_posed, rtol=0, atol=1e-5)
+            torch.testing.assert_close(d, d_ref, rtol=0, atol=1e-5)
+
+            vertex_ids = list(range(0, 6890, 23))
+            d = star(self.pose, self.betas, self.trans, vertex_ids=vertex_ids)
+            torch.testing.assert_close(d, d_ref[:, vertex_ids], rtol=0, atol=1e-5)
+
+    def test_deepcopy(self):
+        from star.pytorch.star import STAR
+        star = STAR(gender=GENDERS[0], num_betas=10, pose_blend='sparse')
+        star(self.pose, self.betas, self.trans, vertex_ids=[0, 1, 2])
+        star_copy = copy.deepcopy(star)
+        torch.testing.assert_close(star_copy(self.pose, self.betas, self.trans), star(self.pose, self.betas, self.trans), rtol=0, atol=0)
+
+
+@unittest.skipUnless(GENDERS, 'The STAR models are not available')
+class TestStateDict(unittest.TestCase):
+    def setUp(self):
+        generator = torch.Generator().manual_seed(0)
+        self.pose = torch.randn(8, 72, generator=generator)
+        self.betas = 2 * torch.randn(8, 10, generator=generator)
+        self.trans = 2 * torch.randn(8, 3, generator=generator)
+
+    def test_joints_follow_loaded_shape(self):
+        from star.pytorch.star import STAR
+        star = STAR(gender=GENDERS[0], num_betas=10)
+        state_dict = star.state_dict()
+        state_dict['v_template'] = state_dict['v_template'] + 0.1
+        state_dict['shapedirs'] = 2 * state_dict['shapedirs']
+        star.load_state_dict(state_dict)
+        d = star(self.pose, self.betas, self.trans, outputs=('v_shaped', 'J'))
+        torch.testing.assert_close(d.J, torch.matmul(star.J_regressor, d.v_shaped), rtol=0, atol=1e-5)
+
+    def test_sparse_skinning_follows_loaded_weights(self):
+        from star.pytorch.star import STAR
+        reference = STAR(gender=GENDERS[0], num_betas=10, skinning='dense')
+        star = STAR(gender=GENDERS[0], num_betas=10, skinning='sparse')
+        state_dict = reference.state_dict()
+        state_dict['weights'] = state_dict['weights'].roll(1, dims=1)
+        reference.load_state_dict(state_dict)
+        star.load_state_dict(state_dict)
+        torch.testing.assert_close(star(self.pose, self.betas, self.trans), reference(self.pose, self.betas, self.trans), rtol=0, atol=1e-5)
+
+
+if __name__ == '__main__':
+    unittest.main()